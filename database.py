@@ -1,6 +1,6 @@
 from dotenv import load_dotenv
 import os
-from supabase import create_client, Client
+from supabase import create_client, Client, AsyncClient
 
 load_dotenv()
 
@@ -12,3 +12,8 @@ if not supabase_url or not supabase_key:
     raise ValueError("SUPABASE_URL or SUPABASE_SERVICE_KEY is not set")
 
 supabase: Client = create_client(supabase_url, supabase_key)
+
+# For the API's async route handlers: awaiting it never blocks the event loop, and its
+# HTTP connection pool is shared by every request in the process. The service key needs
+# no auth session, so the client can be built here instead of awaiting acreate_client().
+async_supabase: AsyncClient = AsyncClient(supabase_url, supabase_key)
@@ -1,9 +1,28 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from routes import users,project,files,chats
+from routes.auth import warm_jwks
+from services.retrieval_service import query_embedding_cache
+from services.vector_index_service import warm_indexes
+from database import async_supabase
+from services.project_cache_service import start_request_scope, end_request_scope
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_jwks()
+    # Load the local vector indexes of recently active projects before traffic arrives
+    try:
+        await run_in_threadpool(warm_indexes)
+    except Exception as e:
+        print(f"⚠️ Vector index warm-up failed: {e}")
+    yield
+    # Close the pooled connections of the shared async Supabase client
+    await async_supabase.postgrest.aclose()
+
 
 # Create a FastAPI app
 app = FastAPI(
@@ -13,7 +32,8 @@ app = FastAPI(
     contact={
         "name": "Karthik",
         "email": "karthik@example.com",
-    }
+    },
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -25,6 +45,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Fresh request-scoped memo for project ownership / settings lookups
+@app.middleware("http")
+async def request_scoped_cache(request, call_next):
+    token = start_request_scope()
+    try:
+        return await call_next(request)
+    finally:
+        end_request_scope(token)
+
 app.include_router(users.router)
 app.include_router(project.router)
 app.include_router(files.router)
@@ -39,6 +68,15 @@ def read_root():
 def health_check():
     return {"message": "OK"}
 
+@app.get("/health/cache")
+def cache_stats():
+    return {
+        "message": "OK",
+        "data": {
+            "query_embeddings": query_embedding_cache.stats()
+        }
+    }
+
 # @app.post("/posts")
 # async def get_posts():
 #     try:
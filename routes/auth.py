@@ -1,39 +1,179 @@
 import os
+import hashlib
+import threading
+import time
+import httpx
+import jwt
 from fastapi import Request,HTTPException
-from clerk_backend_api import AuthenticateRequestOptions,Clerk, HttpClient
+from fastapi.concurrency import run_in_threadpool
+from services.cache_service import MemoryLRUCache
 
 
 
-clerk_client = Clerk(bearer_auth=os.getenv("CLERK_SECRET_KEY"))
+CLERK_SECRET_KEY = os.getenv("CLERK_SECRET_KEY")
+
+# Clerk's Backend API serves the instance's signing keys; a Frontend API
+# "/.well-known/jwks.json" URL works too and needs no secret key
+CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL", "https://api.clerk.com/v1/jwks")
+
+# Optional PEM public key ("JWKS Public Key" in the Clerk dashboard); with it no JWKS is fetched at all
+CLERK_JWT_KEY = (os.getenv("CLERK_JWT_KEY") or "").replace("\\n", "\n") or None
+
+# Optional: also require the token's issuer (the instance's Frontend API URL)
+CLERK_ISSUER = os.getenv("CLERK_ISSUER")
+
+# Keys older than this are refreshed in the background; unknown key ids refresh immediately
+CLERK_JWKS_TTL = float(os.getenv("CLERK_JWKS_TTL", "3600"))
+
+# Tolerated clock difference for exp / nbf / iat
+CLERK_CLOCK_SKEW = int(os.getenv("CLERK_CLOCK_SKEW", "5"))
 
 ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS',"http://localhost:3000").split(',')
 
+# Verified token -> (clerk_id, exp); an entry never outlives its token
+TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "60"))
+token_cache = MemoryLRUCache(max_entries=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000")), ttl=TOKEN_CACHE_TTL)
+
+# Don't hammer the JWKS endpoint with tokens carrying bogus key ids
+JWKS_MIN_REFRESH_INTERVAL = 30
+
+
+class ClerkJWKS:
+    """
+    In-process copy of the Clerk instance's signing keys, keyed by key id.
+
+    Lookups are dictionary reads. Stale keys keep being served while a
+    background thread refreshes them; only an unknown key id (key rotation)
+    fetches synchronously, at most once per JWKS_MIN_REFRESH_INTERVAL.
+    """
+
+    def __init__(self, url: str, secret_key: str = None, ttl: float = 3600):
+        self.url = url
+        self.secret_key = secret_key
+        self.ttl = ttl
+        self.keys = {}
+        self.fetched_at = 0.0
+        self.last_attempt = None
+        self._lock = threading.Lock()
+        # Separate from _lock (held during fetches) so scheduling a refresh never waits
+        self._refreshing_lock = threading.Lock()
+        self._refreshing = False
+
+    def refresh(self):
+        with self._lock:
+            if self.last_attempt is not None and time.monotonic() - self.last_attempt < JWKS_MIN_REFRESH_INTERVAL:
+                return
+            self.last_attempt = time.monotonic()
+            headers = {"Authorization": f"Bearer {self.secret_key}"} if self.secret_key else {}
+            response = httpx.get(self.url, headers=headers, timeout=10)
+            response.raise_for_status()
+            jwk_set = jwt.PyJWKSet.from_dict(response.json())
+            self.keys = {key.key_id: key.key for key in jwk_set.keys}
+            self.fetched_at = time.monotonic()
+            print(f"🔑 Loaded {len(self.keys)} Clerk signing keys")
+
+    def refresh_in_background(self):
+        with self._refreshing_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Clerk JWKS refresh failed, keeping the cached keys: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def cached_key(self, kid: str):
+        """Key for `kid` if already known (never blocks); schedules a refresh when stale"""
+        key = self.keys.get(kid)
+        if key is not None and time.monotonic() - self.fetched_at > self.ttl:
+            self.refresh_in_background()
+        return key
+
+    def get_key(self, kid: str):
+        """Key for `kid`, fetching the JWKS on a miss (blocking)"""
+        key = self.keys.get(kid)
+        if key is None:
+            self.refresh()
+            key = self.keys.get(kid)
+        if key is None:
+            raise jwt.InvalidKeyError(f"Unknown signing key: {kid}")
+        return key
+
+
+jwks = ClerkJWKS(CLERK_JWKS_URL, CLERK_SECRET_KEY, CLERK_JWKS_TTL)
+
+
+def warm_jwks():
+    """Fetch the signing keys ahead of the first request"""
+    if not CLERK_JWT_KEY:
+        jwks.refresh_in_background()
+
+
+def get_session_token(request: Request) -> str:
+    """Bearer token from the Authorization header, or Clerk's same-origin __session cookie"""
+    authorization = request.headers.get("Authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:].strip()
+    return request.cookies.get("__session")
+
+
+def verify_session_token(token: str, key) -> dict:
+    """Check signature, expiry and authorized party of a Clerk session token"""
+    claims = jwt.decode(
+        token,
+        key,
+        algorithms=["RS256"],
+        leeway=CLERK_CLOCK_SKEW,
+        issuer=CLERK_ISSUER,
+        options={"require": ["exp", "iat", "sub"], "verify_iss": bool(CLERK_ISSUER)},
+    )
+    # Same rule as Clerk's SDK: azp is only checked when the token carries one
+    if claims.get("azp") and claims["azp"] not in ALLOWED_ORIGINS:
+        raise jwt.InvalidTokenError(f"Invalid authorized party: {claims['azp']}")
+    return claims
+
+
 async def get_current_user(request:Request) -> str:
     try:
-        request_state = clerk_client.authenticate_request(
-            request,
-            AuthenticateRequestOptions(
-                authorized_parties=["http://localhost:3000"]
-            )
-        )
-        
-        if not request_state.is_signed_in:
+        token = get_session_token(request)
+        if not token:
             raise HTTPException(
             status_code=401,
             detail="Not authenticated"
         )
-            
-        clerk_id = request_state.payload.get("sub")
-        
+
+        # Recently verified tokens are a dictionary lookup
+        token_hash = hashlib.sha256(token.encode()).hexdigest()
+        cached = token_cache.get(token_hash)
+        if cached and cached[1] > time.time():
+            return cached[0]
+
+        # Verified locally against the cached signing keys; only a key id we haven't seen goes to the network
+        if CLERK_JWT_KEY:
+            key = CLERK_JWT_KEY
+        else:
+            kid = jwt.get_unverified_header(token).get("kid")
+            key = jwks.cached_key(kid) or await run_in_threadpool(jwks.get_key, kid)
+        claims = verify_session_token(token, key)
+
+        clerk_id = claims.get("sub")
+
         if not clerk_id:
             raise HTTPException(
             status_code=401,
             detail="Invalid token"
         )
-        
+
+        token_cache.set(token_hash, (clerk_id, claims["exp"]), ttl=max(0, min(TOKEN_CACHE_TTL, claims["exp"] - time.time())))
         return clerk_id
     except Exception as e:
         raise HTTPException(
             status_code=401,
             detail=f"Athentication failed: {str(e)}"
-        )
\ No newline at end of file
+        )
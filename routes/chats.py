@@ -1,9 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends
-from database import supabase
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from database import async_supabase
 from .auth import get_current_user
+from .pagination import PageParams, paginate, page_response
 from pydantic import BaseModel
+from services.retrieval_service import get_project_settings, embed_query, retrieve_chunks, build_citations
+from services.context_service import pack_context, count_tokens
+from services.chat_memory_service import load_history, history_to_messages
+from tasks import update_chat_summary
+from services.answer_cache_service import find_cached_answer, store_answer
+from services.project_cache_service import is_project_owner
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
+import json
 import os
 from dotenv import load_dotenv
 
@@ -17,6 +27,23 @@ llm = ChatOpenAI(
     openai_api_key=os.getenv("OPENROUTER_API_KEY")
 )
 
+SYSTEM_PROMPT = "You are a helpful AI assistant. Provide clear, concise, and accurate responses."
+
+GROUNDED_SYSTEM_PROMPT = """You are a helpful AI assistant. Answer the user's question using the numbered context excerpts below.
+Cite the excerpts you use as [n]. If the context does not contain the answer, say so instead of guessing.
+
+CONTEXT:
+{context}"""
+
+# Fields returned by get_chat unless ?detail=true
+CHAT_FIELDS = "id, title, project_id, created_at, updated_at"
+MESSAGE_FIELDS = "id, chat_id, role, content, citations, created_at"
+
+HISTORY_SUMMARY_PROMPT = """
+
+SUMMARY OF THE EARLIER CONVERSATION:
+{summary}"""
+
 router = APIRouter(
     tags=["chats"],
     prefix="/api"
@@ -33,7 +60,7 @@ async def create_chats(
     clerk_id: str = Depends(get_current_user)
 ):
     try:
-        result = supabase.table('chats').insert({
+        result = await async_supabase.table('chats').insert({
             "title": chat.title,
             "project_id": chat.project_id,
             "clerk_id": clerk_id
@@ -57,7 +84,7 @@ async def delete_chats(
     clerk_id: str = Depends(get_current_user)
 ):
     try:
-        result = supabase.table('chats').delete().eq("id",chat_id).eq("clerk_id",clerk_id).execute()
+        result = await async_supabase.table('chats').delete().eq("id",chat_id).eq("clerk_id",clerk_id).execute()
         
         if not result.data:
             raise HTTPException(status_code=404,detail="Chat not found or access denied")
@@ -75,27 +102,42 @@ async def delete_chats(
 @router.get("/chats/{chat_id}")
 async def get_chat(
     chat_id: str,
-    clerk_id: str = Depends(get_current_user)
+    clerk_id: str = Depends(get_current_user),
+    page: PageParams = Depends()
 ):
+    """
+        Chat with one page of its messages: the newest page by default, older pages
+        via `cursor`, or with `updated_since` only the messages added since then.
+        Messages are returned oldest first either way.
+    """
     try:
         # Get the chat and verify it belongs to the user AND has a project_id
-        result = supabase.table('chats').select('*').eq('id', chat_id).eq('clerk_id', clerk_id).execute()
+        result = await async_supabase.table('chats').select("*" if page.detail else CHAT_FIELDS).eq('id', chat_id).eq('clerk_id', clerk_id).execute()
         
         if not result.data:
             raise HTTPException(status_code=404, detail="Chat not found or access denied")
         
         chat = result.data[0]
         
-        # Get messages for this chat
-        messages_result = supabase.table('messages').select('*').eq('chat_id', chat_id).order('created_at', desc=False).execute()
+        # Get a page of messages for this chat (messages never change, so "changed" means created)
+        messages_result = await paginate(
+            async_supabase.table('messages').select("*" if page.detail else MESSAGE_FIELDS).eq('chat_id', chat_id),
+            page,
+            changed_column="created_at"
+        ).execute()
+        messages, pagination = page_response(messages_result.data, page, changed_column="created_at")
         
         # Add messages to chat object
-        chat['messages'] = messages_result.data or []
+        chat['messages'] = messages if page.updated_since else messages[::-1]
+        chat['pagination'] = pagination
         
         return {
             "message": "Chat retrieved successfully",
             "data": chat
         }
+    
+    except HTTPException as e:
+        raise e
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get chat: {str(e)}")
@@ -103,66 +145,246 @@ async def get_chat(
 class SendMessageRequest(BaseModel):
     content: str
 
+async def get_owned_chat(project_id: str, chat_id: str, clerk_id: str) -> dict:
+    """
+        The chat row (with its history summary) if the user owns both the project and the chat, and the chat
+        belongs to the project; 404 otherwise. Must run before anything is read
+        from or written to the project or the chat on the user's behalf.
+    """
+    if not await is_project_owner(project_id, clerk_id):
+        raise HTTPException(status_code=404, detail="Project not found or access denied")
+    
+    result = await async_supabase.table('chats').select("id, project_id, history_summary, summarized_until").eq('id', chat_id).eq('clerk_id', clerk_id).eq('project_id', project_id).execute()
+    if not result.data:
+        raise HTTPException(status_code=404, detail="Chat not found or access denied")
+    return result.data[0]
+
+async def save_message(chat_id: str, clerk_id: str, role: str, content: str, citations: list = None):
+    """Insert a chat message and return the stored row"""
+    message_data = {
+        "chat_id": chat_id,
+        "content": content,
+        "role": role,
+        "clerk_id": clerk_id
+    }
+    if citations is not None:
+        message_data["citations"] = citations
+    
+    result = await async_supabase.table('messages').insert(message_data).execute()
+    return result.data[0]
+
+def prepare_answer(chat: dict, message: str, user_message_id: str = None) -> dict:
+    """
+        Everything that happens before generation: conversation memory, answer
+        cache lookup, retrieval and prompt building. Returns a dict with either a
+        cached `answer` or the `prompt` messages to send to the LLM, plus
+        citations and metrics.
+        `chat` is the row returned by get_owned_chat; the project whose chunks and
+        cached answers are read is taken from it, never from the request.
+        Blocking (sync clients and thread pools), so handlers run it with run_in_threadpool.
+    """
+    project_id = chat["project_id"]
+    
+    # Rolling summary + last turns of this chat (bounded however long the chat is)
+    history = load_history(chat, exclude_message_id=user_message_id)
+    # Follow-up questions depend on the conversation, so only opening questions share answers
+    cacheable = not (history["summary"] or history["messages"])
+    
+    # Reuse the answer to an equivalent earlier question in this project if there is one
+    settings = get_project_settings(project_id)
+    query_embedding = embed_query(message)
+    cached_answer, cache_version = find_cached_answer(project_id, settings, query_embedding) if cacheable else (None, None)
+    
+    if cached_answer:
+        print(f"⚡ Answer cache hit (similarity {cached_answer['similarity']:.3f})")
+        return {
+            "answer": cached_answer['answer'],
+            "citations": cached_answer['citations'] or [],
+            "retrieval": {
+                "answer_cache": "hit",
+                "answer_cache_similarity": cached_answer['similarity']
+            },
+            "history": history
+        }
+    
+    # Retrieve the most relevant chunks of the project (one RPC round trip)
+    print(f"🔎 Retrieving context...")
+    chunks, retrieval_metrics = retrieve_chunks(project_id, message, settings)
+    retrieval_metrics["answer_cache"] = "miss" if cacheable else "skipped"
+    print(f"✅ Retrieved {len(chunks)} candidate chunks: {retrieval_metrics}")
+    
+    # Pack the chunks into the token budget; citations follow the packed numbering
+    context, chunks, context_metrics = pack_context(chunks, settings)
+    retrieval_metrics.update(context_metrics)
+    
+    # System prompt grounded in the retrieved context + conversation so far + user message
+    system_prompt = GROUNDED_SYSTEM_PROMPT.format(context=context) if chunks else SYSTEM_PROMPT
+    if history["summary"]:
+        system_prompt += HISTORY_SUMMARY_PROMPT.format(summary=history["summary"])
+    prompt = [SystemMessage(content=system_prompt), *history_to_messages(history), HumanMessage(content=message)]
+    
+    retrieval_metrics["history_messages"] = len(history["messages"])
+    retrieval_metrics["history_tokens"] = history["tokens"]
+    retrieval_metrics["prompt_tokens"] = sum(count_tokens(prompt_message.content) for prompt_message in prompt)
+    print(f"📦 Prompt: {retrieval_metrics['prompt_tokens']} tokens, {len(chunks)} chunks in context, {len(history['messages'])} history messages")
+    return {
+        "answer": None,
+        "prompt": prompt,
+        "citations": build_citations(chunks),
+        "retrieval": retrieval_metrics,
+        "history": history,
+        "cacheable": cacheable,
+        "cache_version": cache_version,
+        "settings": settings,
+        "query_embedding": query_embedding
+    }
+
+def remember_answer(project_id: str, message: str, turn: dict, ai_response: str):
+    """Add a freshly generated answer to the project's answer cache"""
+    if turn["answer"] is None and turn["cacheable"]:
+        store_answer(project_id, turn["cache_version"], turn["settings"], message, turn["query_embedding"], ai_response, turn["citations"])
+
+def refresh_chat_summary(chat_id: str, turn: dict):
+    """Queue the summariser once enough turns have left the verbatim window"""
+    if turn["history"]["needs_summary"]:
+        update_chat_summary.delay(chat_id)
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
 @router.post("/projects/{project_id}/chats/{chat_id}/messages")
 async def send_message(
+    project_id: str,
     chat_id: str,
     request: SendMessageRequest,
     clerk_id: str = Depends(get_current_user)
 ):
     """
-        User message → LLM → AI response
+        User message → retrieve project context → LLM → AI response
     """
     try:
         message = request.content
         
         print(f"💬 New message: {message[:50]}...")
         
+        # 0. The project and the chat must belong to the user before anything is retrieved
+        chat = await get_owned_chat(project_id, chat_id, clerk_id)
+        
         # 1. Save user message
         print(f"💾 Saving user message...")
-        user_message_result = supabase.table('messages').insert({
-            "chat_id": chat_id,
-            "content": message,
-            "role": "user",
-            "clerk_id": clerk_id
-        }).execute()
-        
-        user_message = user_message_result.data[0]
+        user_message = await save_message(chat_id, clerk_id, "user", message)
         print(f"✅ User message saved: {user_message['id']}")
         
-        # 2. Call LLM with system prompt + user message
-        print(f"🤖 Calling LLM...")
-        messages = [
-            SystemMessage(content="You are a helpful AI assistant. Provide clear, concise, and accurate responses."),
-            HumanMessage(content=message)
-        ]
+        # 2. History / answer cache / retrieval / prompt
+        turn = await run_in_threadpool(prepare_answer, chat, message, user_message['id'])
         
-        response = llm.invoke(messages)
-        ai_response = response.content
+        # 3. Call LLM unless the answer came from the cache
+        if turn["answer"] is not None:
+            ai_response = turn["answer"]
+        else:
+            print(f"🤖 Calling LLM...")
+            response = await llm.ainvoke(turn["prompt"])
+            ai_response = response.content
+            print(f"✅ LLM response received: {len(ai_response)} chars")
+            await run_in_threadpool(remember_answer, project_id, message, turn, ai_response)
         
-        print(f"✅ LLM response received: {len(ai_response)} chars")
-        
-        # 3. Save AI message
+        # 4. Save AI message
         print(f"💾 Saving AI message...")
-        ai_message_result = supabase.table('messages').insert({
-            "chat_id": chat_id,
-            "content": ai_response,
-            "role": "assistant",
-            "clerk_id": clerk_id,
-            "citations": []
-        }).execute()
-        
-        ai_message = ai_message_result.data[0]
+        ai_message = await save_message(chat_id, clerk_id, "assistant", ai_response, turn["citations"])
         print(f"✅ AI message saved: {ai_message['id']}")
+        await run_in_threadpool(refresh_chat_summary, chat_id, turn)
         
-        # 4. Return data
+        # 5. Return data
         return {
             "message": "Messages sent successfully",
             "data": {
                 "userMessage": user_message,
-                "aiMessage": ai_message
+                "aiMessage": ai_message,
+                "retrieval": turn["retrieval"]
             }
         }
         
+    except HTTPException as e:
+        raise e
+        
     except Exception as e:
         print(f"❌ Error in send_message: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/projects/{project_id}/chats/{chat_id}/messages/stream")
+async def stream_message(
+    project_id: str,
+    chat_id: str,
+    request: SendMessageRequest,
+    http_request: Request,
+    clerk_id: str = Depends(get_current_user)
+):
+    """
+        User message → retrieve project context → LLM tokens streamed as Server-Sent Events
+
+        Events: `user_message` (saved user message), `token` ({"content": ...} per
+        chunk), then `done` ({"aiMessage", "retrieval"}) or `error` ({"detail"}).
+    """
+    try:
+        message = request.content
+        
+        print(f"💬 New streamed message: {message[:50]}...")
+        
+        # Same ownership guard as send_message, before anything is saved or streamed
+        chat = await get_owned_chat(project_id, chat_id, clerk_id)
+        
+        # The user message is persisted before the stream starts
+        user_message = await save_message(chat_id, clerk_id, "user", message)
+        turn = await run_in_threadpool(prepare_answer, chat, message, user_message['id'])
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"❌ Error in stream_message: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def event_stream():
+        yield sse_event("user_message", user_message)
+        
+        parts = []
+        try:
+            if turn["answer"] is not None:
+                parts.append(turn["answer"])
+                yield sse_event("token", {"content": turn["answer"]})
+            else:
+                print(f"🤖 Streaming LLM response...")
+                upstream = llm.astream(turn["prompt"])
+                try:
+                    async for chunk in upstream:
+                        if await http_request.is_disconnected():
+                            print(f"⚠️ Client disconnected from chat {chat_id}, stopping generation")
+                            return
+                        if chunk.content:
+                            parts.append(chunk.content)
+                            yield sse_event("token", {"content": chunk.content})
+                finally:
+                    # Closes the upstream request too when the client goes away mid-stream
+                    await upstream.aclose()
+            
+            ai_response = "".join(parts)
+            print(f"✅ LLM stream finished: {len(ai_response)} chars")
+            await run_in_threadpool(remember_answer, project_id, message, turn, ai_response)
+            
+            # The assistant message (with citations) is persisted once the stream ends
+            ai_message = await save_message(chat_id, clerk_id, "assistant", ai_response, turn["citations"])
+            await run_in_threadpool(refresh_chat_summary, chat_id, turn)
+            yield sse_event("done", {
+                "aiMessage": ai_message,
+                "retrieval": turn["retrieval"]
+            })
+        except Exception as e:
+            print(f"❌ Error while streaming message: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Don't let proxies buffer the stream
+        }
+    )
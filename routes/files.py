@@ -1,10 +1,17 @@
 from turtle import delay
 from fastapi import APIRouter, HTTPException, Depends
-from database import supabase
-from tasks import processing_document
+from fastapi.concurrency import run_in_threadpool
+from database import async_supabase
+from tasks import queue_document_processing
 from .auth import get_current_user
+from .pagination import PageParams, paginate, page_response
 from pydantic import BaseModel,Field
 from services.s3_service import S3Service
+from services.vector_index_service import invalidate_index
+from services.project_cache_service import is_project_owner
+from services.asset_service import presign_assets
+from datetime import datetime, timedelta, timezone
+import os
 
 
 router = APIRouter(
@@ -12,6 +19,19 @@ router = APIRouter(
     prefix="/api/projects"
     )
 
+# Lightweight field set for the file list (?detail=true adds processing_details etc.)
+DOCUMENT_LIST_FIELDS = "id, project_id, filename, file_size, file_type, processing_status, source_type, source_url, created_at, updated_at"
+
+# Chunk fields returned by default; the 1536-dim embedding only with ?include_embeddings=true
+CHUNK_FIELDS = "id, document_id, content, chunk_index, page_number, char_count, type, original_content, content_hash, created_at"
+
+# A document can only be queued again once its last pipeline run has finished
+REPROCESSABLE_STATUSES = ["completed", "failed"]
+
+# ...or once it has sat in an intermediate status this long without a progress
+# write (updated_at), i.e. its worker died mid-pipeline
+REPROCESS_STALE_AFTER = int(os.getenv("REPROCESS_STALE_AFTER", "1800"))
+
 class FileUploadRequest(BaseModel):
     filename: str
     file_size: int
@@ -23,16 +43,24 @@ class UrlRequest(BaseModel):
 @router.get("/{project_id}/files")
 async def get_projects_files(
     project_id: str,
-    clerk_id: str = Depends(get_current_user)
+    clerk_id: str = Depends(get_current_user),
+    page: PageParams = Depends()
 ):
     try:
-        result = supabase.table('project_documents').select("*").eq("project_id",project_id).eq("clerk_id",clerk_id).order("created_at",desc=True).execute()
-        
+        result = await paginate(
+            async_supabase.table('project_documents').select("*" if page.detail else DOCUMENT_LIST_FIELDS).eq("project_id",project_id).eq("clerk_id",clerk_id),
+            page
+        ).execute()
+        files, pagination = page_response(result.data, page)
         
         return{
             "message":"Project files retrieved successfully",
-            "data": result.data or []
+            "data": files,
+            "pagination": pagination
         }
+    
+    except HTTPException as e:
+        raise e
             
     except Exception as e:
         raise HTTPException(
@@ -47,19 +75,19 @@ async def get_upload_url(
     clerk_id: str = Depends(get_current_user)
 ):
     try:
-        project_result = supabase.table("projects").select("id").eq("id",project_id).eq("clerk_id",clerk_id).execute()
-        
-        if not project_result.data:
+        if not await is_project_owner(project_id, clerk_id):
             raise HTTPException(status_code=400,details="Project not found or access denied")
         
-        s3_client = S3Service()
-        presigned_url,s3_key = s3_client.generate_upload_url(
+        # boto3 is blocking; keep it off the event loop
+        s3_client = await run_in_threadpool(S3Service)
+        presigned_url,s3_key = await run_in_threadpool(
+            s3_client.generate_upload_url,
             file_name=file_request.filename,
             file_type=file_request.file_type,
             project_id=project_id
         )
         
-        document_result = supabase.table("project_documents").insert({
+        document_result = await async_supabase.table("project_documents").insert({
             "project_id":project_id,
             "filename":file_request.filename,
             "s3_key":s3_key,
@@ -100,7 +128,7 @@ async def confirm_file_upload(
         if not s3_key:
             raise HTTPException(status_code=400,details="s3_key is required")
         
-        result = supabase.table("project_documents").update({
+        result = await async_supabase.table("project_documents").update({
             "processing_status": "queued"
         }).eq("s3_key",s3_key).eq("project_id",project_id).eq("clerk_id",clerk_id).execute()
         
@@ -111,10 +139,10 @@ async def confirm_file_upload(
         document_id = document['id']
         
         # Start the background preprocessing of the current file
-        task = processing_document.delay(document_id)
+        task = await run_in_threadpool(queue_document_processing, document_id)
         print("starting my Celery")
         # store this in db to tracking
-        supabase.table("project_documents").update({
+        await async_supabase.table("project_documents").update({
             "task_id": task.id
         }).eq("id",document_id).execute()
         
@@ -160,7 +188,7 @@ async def website_process_url(
 
         # Add website Url to database
         document_creation_result = (
-            supabase.table("project_documents")
+            await async_supabase.table("project_documents")
             .insert(
                 {
                     "project_id": project_id,
@@ -187,10 +215,10 @@ async def website_process_url(
         document_id = document['id']
         
         # Start the background preprocessing of the current file
-        task = processing_document.delay(document_id)
+        task = await run_in_threadpool(queue_document_processing, document_id)
 
         # store this in db to tracking
-        supabase.table("project_documents").update({
+        await async_supabase.table("project_documents").update({
             "task_id": task.id
         }).eq("id",document_id).execute()
         
@@ -224,7 +252,7 @@ async def delete_project_document(
     try:
         # Verify document exists and belongs to the current user and Take complete project document record
         document_ownership_verification_result = (
-            supabase.table("project_documents")
+            await async_supabase.table("project_documents")
             .select("*")
             .eq("id", file_id)
             .eq("project_id", project_id)
@@ -241,12 +269,12 @@ async def delete_project_document(
         # Delete file from S3 (only for actual files, not for URLs)
         s3_key = document_ownership_verification_result.data[0]["s3_key"]
         if s3_key:
-            s3_client = S3Service()
-            s3_client.delete_file(file_key=s3_key)
+            s3_client = await run_in_threadpool(S3Service)
+            await run_in_threadpool(s3_client.delete_file, file_key=s3_key)
 
         # Delete document from database
         document_deletion_result = (
-            supabase.table("project_documents")
+            await async_supabase.table("project_documents")
             .delete()
             .eq("id", file_id)
             .eq("project_id", project_id)
@@ -260,6 +288,9 @@ async def delete_project_document(
                 detail="Failed to delete document",
             )
 
+        # The document's chunks went with it (CASCADE); re-verify the local vector index
+        await run_in_threadpool(invalidate_index, project_id)
+
         return {
             "message": "Document deleted successfully",
             "data": document_deletion_result.data[0],
@@ -274,22 +305,93 @@ async def delete_project_document(
             detail=f"An internal server error occurred while deleting project document {file_id} for {project_id}: {str(e)}",
         )
 
+@router.post("/{project_id}/files/{file_id}/reprocess")
+async def reprocess_project_document(
+    project_id: str,
+    file_id: str,
+    current_user_clerk_id: str = Depends(get_current_user),
+):
+    """
+    ! Logic Flow:
+    * 1. Verify document exists, belongs to the current user and is not being processed
+    *    (a run with no progress for REPROCESS_STALE_AFTER seconds counts as dead)
+    * 2. Queue the processing pipeline in reprocess mode: an unchanged source is skipped,
+    *    otherwise only chunks whose content changed are summarised and embedded again
+    * 3. Store the task id for tracking and return the document
+    """
+    try:
+        # Only a finished (or stalled) document is queued again; the status check and the update
+        # are one statement, so two requests can't both start a run that diffs against the other
+        stale_before = (datetime.now(timezone.utc) - timedelta(seconds=REPROCESS_STALE_AFTER)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        document_result = (
+            await async_supabase.table("project_documents")
+            .update({"processing_status": "queued"})
+            .eq("id", file_id)
+            .eq("project_id", project_id)
+            .eq("clerk_id", current_user_clerk_id)
+            .or_(f"processing_status.in.({','.join(REPROCESSABLE_STATUSES)}),updated_at.lt.{stale_before}")
+            .execute()
+        )
+
+        if not document_result.data:
+            existing_result = (
+                await async_supabase.table("project_documents")
+                .select("processing_status")
+                .eq("id", file_id)
+                .eq("project_id", project_id)
+                .eq("clerk_id", current_user_clerk_id)
+                .execute()
+            )
+            if existing_result.data:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Document is already being processed (status: {existing_result.data[0]['processing_status']})",
+                )
+            raise HTTPException(
+                status_code=404,
+                detail="Document not found or you don't have permission to reprocess this document",
+            )
+
+        task = await run_in_threadpool(queue_document_processing, file_id, True)
+
+        # store this in db to tracking
+        await async_supabase.table("project_documents").update({
+            "task_id": task.id
+        }).eq("id", file_id).execute()
+
+        return {
+            "message": "Document reprocessing started",
+            "data": document_result.data[0],
+        }
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"An internal server error occurred while reprocessing project document {file_id} for {project_id}: {str(e)}",
+        )
+
 @router.get("/{project_id}/files/{file_id}/chunks")
 async def get_document_chunks(
     project_id: str,
     file_id: str,
     clerk_id: str = Depends(get_current_user),
+    include_embeddings: bool = False,
 ):
+    """
+        Chunks of a document in order. Images and large tables are S3 assets:
+        each reference in original_content carries a presigned `url`.
+    """
     try:
-        project_result = supabase.table("projects").select("id").eq('id',project_id).eq('clerk_id',clerk_id).execute()
-        
-        if not project_result.data:
+        if not await is_project_owner(project_id, clerk_id):
             raise HTTPException(
             status_code=404,
             detail="Project not found or access denied"
         )
             
-        doc_result = supabase.table("project_documents").select("id").eq('id',file_id).eq('project_id',project_id).execute()
+        doc_result = await async_supabase.table("project_documents").select("id").eq('id',file_id).eq('project_id',project_id).execute()
         
         if not doc_result.data:
             raise HTTPException(
@@ -297,12 +399,23 @@ async def get_document_chunks(
             detail="Document not found"
         )
             
-        chunk_result = supabase.table("document_chunks").select("*").eq('document_id',file_id).order('chunk_index').execute()
+        fields = f"{CHUNK_FIELDS}, embedding" if include_embeddings else CHUNK_FIELDS
+        chunk_result = await async_supabase.table("document_chunks").select(fields).eq('document_id',file_id).order('chunk_index').execute()
+        chunks = chunk_result.data or []
+        
+        # Signing is local but CPU-bound, one signature per asset
+        def sign_chunks():
+            for chunk in chunks:
+                chunk['original_content'] = presign_assets(chunk.get('original_content'))
+            return chunks
         
         return{
             "message": "Document chunks retrived successfully",
-            "data": chunk_result.data or []
+            "data": await run_in_threadpool(sign_chunks)
         }
+    
+    except HTTPException as e:
+        raise e
         
     except Exception as e:
         print(f"Error getting chunks: {str(e)}")
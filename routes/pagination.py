@@ -0,0 +1,93 @@
+import base64
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException, Query
+
+
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "50"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "200"))
+
+
+class PageParams:
+    """
+    Query parameters shared by the list endpoints.
+
+    * cursor: opaque `next_cursor` from the previous page
+    * limit: page size, capped at PAGE_SIZE_MAX
+    * updated_since: only rows changed after this time, oldest change first,
+      for clients polling for changes instead of reloading the list
+    * detail: full rows instead of the lightweight list fields
+    """
+
+    def __init__(
+        self,
+        cursor: Optional[str] = None,
+        limit: int = Query(PAGE_SIZE_DEFAULT, ge=1),
+        updated_since: Optional[datetime] = None,
+        detail: bool = False,
+    ):
+        self.cursor = cursor
+        self.limit = min(limit, PAGE_SIZE_MAX)
+        self.updated_since = updated_since
+        self.detail = detail
+
+
+def encode_cursor(value: str, row_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    (timestamp, id) from a cursor. Both are parsed and re-serialised, since
+    they end up inside a PostgREST filter string: anything that isn't an ISO
+    timestamp and a UUID is rejected instead of reaching the query.
+    """
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(value).isoformat(), str(uuid.UUID(row_id))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(query, page: PageParams, changed_column: str = "updated_at"):
+    """
+    Apply keyset pagination to a PostgREST query.
+
+    Lists run newest first on (created_at, id); with updated_since they run
+    oldest change first on (changed_column, id) so a client can resume
+    from the last change it saw. One extra row is fetched to tell whether
+    there is a next page (see page_response).
+    """
+    if page.updated_since:
+        column = changed_column
+        query = query.gt(column, page.updated_since.isoformat())
+        if page.cursor:
+            value, row_id = decode_cursor(page.cursor)
+            query = query.or_(f'{column}.gt."{value}",and({column}.eq."{value}",id.gt.{row_id})')
+        query = query.order(column).order("id")
+    else:
+        column = "created_at"
+        if page.cursor:
+            value, row_id = decode_cursor(page.cursor)
+            query = query.or_(f'{column}.lt."{value}",and({column}.eq."{value}",id.lt.{row_id})')
+        query = query.order(column, desc=True).order("id", desc=True)
+
+    return query.limit(page.limit + 1)
+
+
+def page_response(rows: list, page: PageParams, changed_column: str = "updated_at") -> tuple:
+    """Trim the extra row and build the pagination block: (rows, pagination)"""
+    rows = rows or []
+    has_more = len(rows) > page.limit
+    rows = rows[:page.limit]
+
+    column = changed_column if page.updated_since else "created_at"
+    next_cursor = encode_cursor(rows[-1][column], rows[-1]["id"]) if has_more else None
+    return rows, {
+        "limit": page.limit,
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+    }
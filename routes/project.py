@@ -1,7 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
-from database import supabase
+from fastapi.concurrency import run_in_threadpool
+from database import async_supabase
 from .auth import get_current_user
+from .pagination import PageParams, paginate, page_response
 from pydantic import BaseModel
+from services.vector_index_service import drop_index
+from services.project_cache_service import is_project_owner, get_project_settings_row_async, invalidate_project, invalidate_project_settings
 
 
 router = APIRouter(
@@ -9,6 +13,10 @@ router = APIRouter(
     prefix="/api/projects"
     )
 
+# Lightweight field sets for the list views (?detail=true returns full rows)
+PROJECT_LIST_FIELDS = "id, name, description, created_at, updated_at"
+CHAT_LIST_FIELDS = "id, title, project_id, created_at, updated_at"
+
 class ProjectCreate(BaseModel):
     name: str
     description: str = ""
@@ -29,27 +37,33 @@ class ProjectSettings(BaseModel):
     
 
 @router.get("/")
-async def get_projects(current_user_clerk_id: str = Depends(get_current_user)): 
+async def get_projects(current_user_clerk_id: str = Depends(get_current_user), page: PageParams = Depends()): 
 
     """
     ! Logic Flow
     * 1. Get current user clerk_id
-    * 2. Query projects table for projects related to the current user
-    * 3. Return projects data
+    * 2. Query one page of the projects table for projects related to the current user
+    * 3. Return projects data and the cursor of the next page
     """
     try:
-        projects_query_result = (
-            supabase.table("projects")
-            .select("*")
-            .eq("clerk_id", current_user_clerk_id)
-            .execute()
-        )
+        projects_query_result = await paginate(
+            async_supabase.table("projects")
+            .select("*" if page.detail else PROJECT_LIST_FIELDS)
+            .eq("clerk_id", current_user_clerk_id),
+            page
+        ).execute()
+
+        projects, pagination = page_response(projects_query_result.data, page)
 
         return {
             "message": "Projects retrieved successfully",
-            "data": projects_query_result.data or [],
+            "data": projects,
+            "pagination": pagination,
         }
 
+    except HTTPException as e:
+        raise e
+
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -57,7 +71,7 @@ async def get_projects(current_user_clerk_id: str = Depends(get_current_user)):
         )
         
 @router.post("/")
-def create_project(project_data: ProjectCreate,clerk_id=Depends(get_current_user)):
+async def create_project(project_data: ProjectCreate,clerk_id=Depends(get_current_user)):
     try:
         project_insert_data = {
             "name": project_data.name,
@@ -66,7 +80,7 @@ def create_project(project_data: ProjectCreate,clerk_id=Depends(get_current_user
         }
 
         project_creation_result = (
-            supabase.table("projects").insert(project_insert_data).execute()
+            await async_supabase.table("projects").insert(project_insert_data).execute()
         )
 
         if not project_creation_result.data:
@@ -94,12 +108,12 @@ def create_project(project_data: ProjectCreate,clerk_id=Depends(get_current_user
         }  
         
         project_settings_creation_result = (
-            supabase.table("project_settings").insert(project_settings_data).execute()
+            await async_supabase.table("project_settings").insert(project_settings_data).execute()
         )
   
         if not project_settings_creation_result.data:
             # Rollback: Delete the project if settings creation fails
-            supabase.table("projects").delete().eq(
+            await async_supabase.table("projects").delete().eq(
                 "id", newly_created_project["id"]
             ).execute()
             raise HTTPException(
@@ -131,15 +145,7 @@ async def delete_project(
     """
     try:
         # Verify if the project exists and belongs to the current user
-        project_ownership_verification_result = (
-            supabase.table("projects")
-            .select("id")
-            .eq("id", project_id)
-            .eq("clerk_id", current_user_clerk_id)
-            .execute()
-        )
-
-        if not project_ownership_verification_result.data:
+        if not await is_project_owner(project_id, current_user_clerk_id):
             raise HTTPException(
                 status_code=404,  # Not Found - project doesn't exist or doesn't belong to user
                 detail="Project not found or you don't have permission to delete it",
@@ -147,7 +153,7 @@ async def delete_project(
 
         # Delete project ~ "CASCADE" will automatically delete all related data: project_settings, project_documents, document_chunks, chats, messages, etc.
         project_deletion_result = (
-            supabase.table("projects")
+            await async_supabase.table("projects")
             .delete()
             .eq("id", project_id)
             .eq("clerk_id", current_user_clerk_id)
@@ -161,6 +167,8 @@ async def delete_project(
             )
 
         successfully_deleted_project = project_deletion_result.data[0]
+        invalidate_project(project_id, current_user_clerk_id)
+        await run_in_threadpool(drop_index, project_id)
 
         return {
             "message": "Project deleted successfully",
@@ -181,7 +189,7 @@ async def get_projects(
     clerk_id: str = Depends(get_current_user)
 ):
     try:
-        result = supabase.table('projects').select("*").eq("id",project_id).eq("clerk_id",clerk_id).execute()
+        result = await async_supabase.table('projects').select("*").eq("id",project_id).eq("clerk_id",clerk_id).execute()
         
         if not result.data:
             raise HTTPException(status_code=404,detail="Project not found")
@@ -200,15 +208,24 @@ async def get_projects(
 @router.get("/{project_id}/chats")
 async def get_projects_chats(
     project_id: str,
-    clerk_id: str = Depends(get_current_user)
+    clerk_id: str = Depends(get_current_user),
+    page: PageParams = Depends()
 ):
     try:
-        result = supabase.table('chats').select("*").eq("project_id",project_id).eq("clerk_id",clerk_id).order("created_at",desc=True).execute()
+        result = await paginate(
+            async_supabase.table('chats').select("*" if page.detail else CHAT_LIST_FIELDS).eq("project_id",project_id).eq("clerk_id",clerk_id),
+            page
+        ).execute()
+        chats, pagination = page_response(result.data, page)
         
         return{
             "message":"Project retrieved successfully",
-            "data": result.data or []
+            "data": chats,
+            "pagination": pagination
         }
+    
+    except HTTPException as e:
+        raise e
             
     except Exception as e:
         raise HTTPException(
@@ -222,13 +239,13 @@ async def get_projects_settings(
     clerk_id: str = Depends(get_current_user)
 ):
     try:
-        result = supabase.table('project_settings').select("*").eq("project_id",project_id).execute()
-        if not result.data:
+        project_settings = await get_project_settings_row_async(project_id)
+        if not project_settings:
             raise HTTPException(status_code=404,detail="Project settings not found")
         
         return{
             "message":"Project settings retrieved successfully",
-            "data": result.data[0]
+            "data": project_settings
         }
             
     except Exception as e:
@@ -245,13 +262,12 @@ async def update_projects_settings(
 ):
     try: 
         # First verify the project exists and belongs to the user
-        project_result = supabase.table("projects").select("id").eq("id", project_id).eq("clerk_id", clerk_id).execute()    
-
-        if not project_result.data:
+        if not await is_project_owner(project_id, clerk_id):
             raise HTTPException(status_code=404, detail = f"Project not found or access denied")
 
         # Perform the update
-        result = supabase.table("project_settings").update(settings.model_dump()).eq("project_id", project_id).execute()
+        result = await async_supabase.table("project_settings").update(settings.model_dump()).eq("project_id", project_id).execute()
+        invalidate_project_settings(project_id)
 
         if not result.data:
             raise HTTPException(status_code=404, detail = f"Project settings not found")
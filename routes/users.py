@@ -1,6 +1,6 @@
 from fastapi import APIRouter,HTTPException,Request
 from pydantic import BaseModel
-from database import supabase
+from database import async_supabase
 from svix.webhooks import Webhook, WebhookVerificationError
 import os 
 
@@ -54,7 +54,7 @@ async def clerk_webhook(request: Request):
         print(f"Received event: {event_type}")
         
         if event_type == "user.created":
-            response = supabase.table("users").insert({
+            response = await async_supabase.table("users").insert({
                 "clerk_id": data["id"],
             }).execute()
             print(f"User created: {data['id']}")
@@ -0,0 +1,89 @@
+from database import supabase
+from dotenv import load_dotenv
+import hashlib
+import json
+import os
+
+
+load_dotenv()
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+
+# Minimum cosine similarity between questions for a cached answer to be reused
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# Entries older than this are neither served nor kept
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Newest entries kept per project; older ones are dropped as new answers arrive
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "500"))
+
+# Settings that change which chunks are retrieved, and therefore the answer
+ANSWER_SETTINGS_KEYS = (
+    "embedding_model",
+    "rag_strategy",
+    "chunks_per_search",
+    "final_context_size",
+    "similarity_threshold",
+    "number_of_queries",
+    "reranking_enabled",
+    "reranking_model",
+    "vector_weight",
+    "keyword_weight",
+)
+
+
+def settings_hash(settings: dict) -> str:
+    payload = json.dumps({key: settings.get(key) for key in ANSWER_SETTINGS_KEYS}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def find_cached_answer(project_id: str, settings: dict, query_embedding: list) -> tuple:
+    """
+    Look up the cached answer to the most similar earlier question in the
+    project (asked under the same settings, not expired).
+
+    Returns (cached_answer or None, project_version). The version must be
+    passed to store_answer for an answer generated after this lookup: database
+    triggers bump it whenever a document of the project is added, deleted or
+    finishes processing, or its settings change, and entries from an older
+    version are never served. The version is None when the lookup failed.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+
+    try:
+        result = supabase.rpc("match_answer_cache", {
+            "query_embedding": query_embedding,
+            "p_project_id": project_id,
+            "p_settings_hash": settings_hash(settings),
+            "similarity_threshold": ANSWER_CACHE_SIMILARITY,
+            "max_age_seconds": ANSWER_CACHE_TTL,
+        }).execute()
+    except Exception as e:
+        print(f"⚠️ Answer cache lookup failed: {e}")
+        return None, None
+
+    row = result.data[0] if result.data else {}
+    return (row if row.get("id") else None), row.get("project_version")
+
+
+def store_answer(project_id: str, project_version: int, settings: dict, question: str, query_embedding: list, answer: str, citations: list):
+    """Cache an answer computed at `project_version`; dropped if the project was invalidated since"""
+    if not ANSWER_CACHE_ENABLED or project_version is None:
+        return
+
+    try:
+        supabase.rpc("store_answer_cache", {
+            "p_project_id": project_id,
+            "p_project_version": project_version,
+            "p_settings_hash": settings_hash(settings),
+            "p_question": question,
+            "p_question_embedding": query_embedding,
+            "p_answer": answer,
+            "p_citations": citations,
+            "max_entries": ANSWER_CACHE_MAX_ENTRIES,
+            "max_age_seconds": ANSWER_CACHE_TTL,
+        }).execute()
+    except Exception as e:
+        print(f"⚠️ Answer cache write failed: {e}")
@@ -0,0 +1,120 @@
+from services.s3_service import s3_service
+from services.cache_service import MemoryLRUCache
+from dotenv import load_dotenv
+import base64
+import binascii
+import hashlib
+import os
+
+
+load_dotenv()
+
+# Chunk assets live under this prefix, keyed by the SHA-256 of their bytes,
+# so an image repeated across slides, documents or projects is stored once
+ASSET_PREFIX = os.getenv("ASSET_PREFIX", "assets")
+
+# Tables whose HTML is longer than this move to S3 as well; shorter ones stay inline
+TABLE_INLINE_MAX_CHARS = int(os.getenv("TABLE_INLINE_MAX_CHARS", "4000"))
+
+# Lifetime of the presigned URLs handed out by the chunks endpoint
+ASSET_URL_EXPIRES_IN = int(os.getenv("ASSET_URL_EXPIRES_IN", "3600"))
+
+# Content-addressed objects never change
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Keys known to be in the bucket, so repeats skip the HEAD request too
+known_assets = MemoryLRUCache(max_entries=100_000)
+
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png", "png"),
+    (b"\xff\xd8\xff", "image/jpeg", "jpg"),
+    (b"GIF8", "image/gif", "gif"),
+    (b"RIFF", "image/webp", "webp"),
+]
+
+
+def sniff_image_type(data: bytes) -> tuple:
+    """(content_type, extension) from the magic bytes; unstructured extracts JPEG by default"""
+    for signature, content_type, extension in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return content_type, extension
+    return "image/jpeg", "jpg"
+
+
+def store_asset(data: bytes, content_type: str, extension: str) -> dict:
+    """Upload `data` once under its content hash and return the reference stored in chunk rows"""
+    digest = hashlib.sha256(data).hexdigest()
+    key = f"{ASSET_PREFIX}/{digest[:2]}/{digest}.{extension}"
+
+    if not known_assets.get(key):
+        if not s3_service.object_exists(key):
+            s3_service.upload_bytes(key, data, content_type, cache_control=ASSET_CACHE_CONTROL)
+        known_assets.set(key, True)
+
+    return {
+        "asset": key,
+        "content_type": content_type,
+        "size": len(data),
+    }
+
+
+def is_asset_ref(value) -> bool:
+    return isinstance(value, dict) and "asset" in value
+
+
+def needs_offload(original_content) -> bool:
+    """Whether a stored original_content still holds inline images or large inline tables"""
+    if not isinstance(original_content, dict):
+        return False
+    return any(not is_asset_ref(image) for image in original_content.get("images") or []) or any(
+        isinstance(table, str) and len(table) > TABLE_INLINE_MAX_CHARS
+        for table in original_content.get("tables") or []
+    )
+
+
+def offload_original_content(original_content: dict) -> dict:
+    """
+    Replace base64 images (always) and large table HTML with S3 asset
+    references, leaving small tables inline for the context packer.
+    """
+    slim = dict(original_content)
+
+    if original_content.get("images"):
+        images = []
+        for image in original_content["images"]:
+            if is_asset_ref(image):
+                images.append(image)
+                continue
+            try:
+                data = base64.b64decode(image, validate=True)
+            except (binascii.Error, ValueError):
+                # Not decodable: drop it rather than keep an opaque payload in the row
+                print("     ⚠️ Skipping an image that is not valid base64")
+                continue
+            images.append(store_asset(data, *sniff_image_type(data)))
+        slim["images"] = images
+
+    if original_content.get("tables"):
+        slim["tables"] = [
+            store_asset(table.encode("utf-8"), "text/html; charset=utf-8", "html")
+            if isinstance(table, str) and len(table) > TABLE_INLINE_MAX_CHARS else table
+            for table in original_content["tables"]
+        ]
+
+    return slim
+
+
+def presign_assets(original_content: dict, expires_in: int = ASSET_URL_EXPIRES_IN) -> dict:
+    """Copy of original_content with a presigned download `url` on every asset reference"""
+    if not isinstance(original_content, dict):
+        return original_content
+
+    signed = dict(original_content)
+    for field in ("images", "tables"):
+        if signed.get(field):
+            signed[field] = [
+                {**item, "url": s3_service.generate_download_url(item["asset"], expires_in)}
+                if is_asset_ref(item) else item
+                for item in signed[field]
+            ]
+    return signed
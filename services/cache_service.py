@@ -0,0 +1,194 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+load_dotenv()
+
+# Backend for persistent caches: "disk", "redis" or "none"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "disk")
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(tempfile.gettempdir(), "rag-cache"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/1")
+
+
+class MemoryLRUCache:
+    """
+    Thread-safe in-process LRU cache with an optional per-entry TTL.
+
+    Holds any Python value; meant for small hot data that is cheap to lose.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskLRUCache:
+    """
+    Size-bounded LRU cache stored in a local SQLite file.
+
+    Values are bytes. Once the cache holds more than `max_entries` rows, the
+    least recently read or written ones are evicted. Entries older than `ttl`
+    seconds (if set) count as misses.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000, ttl: float = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_idx ON cache (accessed_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, keys: list) -> dict:
+        """Return {key: value} for the keys that are present and not expired."""
+        if not keys:
+            return {}
+
+        now = time.time()
+        found = {}
+        with self._lock, self._connect() as conn:
+            # SQLite caps the number of bound parameters, so look keys up in slices
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, value, created_at FROM cache WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, value, created_at in rows:
+                    if self.ttl is None or now - created_at < self.ttl:
+                        found[key] = value
+
+            if found:
+                conn.executemany(
+                    "UPDATE cache SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+        return found
+
+    def set_many(self, items: dict):
+        """Store {key: value} pairs, evicting the least recently used rows if over capacity."""
+        if not items:
+            return
+
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(key, value, now, now) for key, value in items.items()]
+            )
+            overflow = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?)",
+                    (overflow,)
+                )
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+
+class RedisCache:
+    """
+    Cache stored in Redis under a namespace prefix.
+
+    Entries expire after `ttl` seconds (if set); size is bounded by the Redis
+    server's own maxmemory/eviction policy.
+    """
+
+    def __init__(self, namespace: str, url: str = CACHE_REDIS_URL, ttl: float = None):
+        import redis
+
+        self.namespace = namespace
+        self.ttl = int(ttl) if ttl else None
+        self.client = redis.Redis.from_url(url)
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get_many(self, keys: list) -> dict:
+        if not keys:
+            return {}
+        values = self.client.mget([self._key(key) for key in keys])
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, items: dict):
+        if not items:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(self._key(key), value, ex=self.ttl)
+        pipe.execute()
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f"{self.namespace}:*", count=1000))
+        for i in range(0, len(keys), 1000):
+            self.client.delete(*keys[i:i + 1000])
+
+
+def build_cache(namespace: str, max_entries: int = 100_000, ttl: float = None, backend: str = None):
+    """Create the persistent cache for `namespace` on the configured backend (None if disabled)."""
+    backend = backend or CACHE_BACKEND
+
+    if backend == "none":
+        return None
+    if backend == "redis":
+        return RedisCache(namespace, ttl=ttl)
+    if backend == "disk":
+        return DiskLRUCache(os.path.join(CACHE_DIR, f"{namespace}.sqlite3"), max_entries=max_entries, ttl=ttl)
+
+    raise ValueError(f"Unknown cache backend: {backend}")
@@ -0,0 +1,137 @@
+from database import supabase
+from services.context_service import count_tokens
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_openai import ChatOpenAI
+from dotenv import load_dotenv
+import os
+
+
+load_dotenv()
+
+# Turns (user + assistant message) always sent verbatim
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "6"))
+
+# Older turns are folded into the summary this many at a time, so the
+# summariser runs every few turns rather than on every message
+CHAT_SUMMARY_BATCH_TURNS = int(os.getenv("CHAT_SUMMARY_BATCH_TURNS", "4"))
+
+# Token cap on the verbatim messages; the oldest ones go first when it is exceeded
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "3000"))
+
+summary_llm = ChatOpenAI(
+    model=os.getenv("CHAT_SUMMARY_MODEL", "gpt-4-turbo"),
+    temperature=0,
+    openai_api_base="https://openrouter.ai/api/v1",
+    openai_api_key=os.getenv("OPENROUTER_API_KEY")
+)
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and an AI assistant.
+Update the summary below with the new messages. Keep the facts, names, numbers, decisions and open questions
+the assistant may need later; drop pleasantries. Write at most {max_words} words.
+
+CURRENT SUMMARY:
+{summary}
+
+NEW MESSAGES:
+{messages}
+
+UPDATED SUMMARY:"""
+
+SUMMARY_MAX_WORDS = 250
+
+# Long answers are clipped before they are summarised
+SUMMARY_MESSAGE_MAX_CHARS = 2000
+
+
+def window_size() -> int:
+    """Most messages that can be waiting for the summariser: the window plus one batch"""
+    return 2 * (CHAT_HISTORY_TURNS + CHAT_SUMMARY_BATCH_TURNS)
+
+
+def load_history(chat: dict, exclude_message_id: str = None) -> dict:
+    """
+    The conversation memory for a prompt: the chat's rolling summary plus the
+    messages not yet folded into it, newest window only. One small query
+    however long the chat is.
+
+    `chat` is the chat row (id, history_summary, summarized_until) as loaded by
+    the caller's ownership check, so only a verified chat's history is read.
+    """
+    query = supabase.table("messages").select("id, role, content, created_at").eq("chat_id", chat["id"])
+    if chat.get("summarized_until"):
+        query = query.gt("created_at", chat["summarized_until"])
+    result = query.order("created_at", desc=True).limit(window_size() + 1).execute()
+
+    messages = [row for row in result.data or [] if row["id"] != exclude_message_id][:window_size()]
+    messages.reverse()
+
+    # Keep the newest messages that fit the token cap
+    recent = []
+    used = 0
+    for row in reversed(messages):
+        tokens = count_tokens(row["content"])
+        if recent and used + tokens > CHAT_HISTORY_MAX_TOKENS:
+            break
+        recent.insert(0, row)
+        used += tokens
+
+    return {
+        "summary": chat.get("history_summary"),
+        "messages": recent,
+        "tokens": used + count_tokens(chat.get("history_summary") or ""),
+        # After this turn's question and answer are saved, a full batch is waiting beyond the window
+        "needs_summary": len(messages) + 2 >= window_size(),
+    }
+
+
+def history_to_messages(history: dict) -> list:
+    return [
+        HumanMessage(content=row["content"]) if row["role"] == "user" else AIMessage(content=row["content"])
+        for row in history["messages"]
+    ]
+
+
+def format_transcript(messages: list) -> str:
+    return "\n".join(f"{row['role'].upper()}: {row['content'][:SUMMARY_MESSAGE_MAX_CHARS]}" for row in messages)
+
+
+def update_summary(chat_id: str) -> bool:
+    """
+    Fold the messages older than the last CHAT_HISTORY_TURNS turns into the
+    chat's summary. Returns whether the summary changed.
+    """
+    chat_result = supabase.table("chats").select("history_summary, summarized_until").eq("id", chat_id).execute()
+    if not chat_result.data:
+        return False
+    chat = chat_result.data[0]
+
+    query = supabase.table("messages").select("role, content, created_at").eq("chat_id", chat_id)
+    if chat.get("summarized_until"):
+        query = query.gt("created_at", chat["summarized_until"])
+    # Oldest unsummarised first; everything but the verbatim window gets folded
+    result = query.order("created_at").limit(window_size() * 2).execute()
+    pending = result.data or []
+    if len(pending) < window_size() * 2:
+        to_fold = pending[:max(0, len(pending) - 2 * CHAT_HISTORY_TURNS)]
+    else:
+        # Far behind (more pending than one query returns): fold this page and catch up next time
+        to_fold = pending
+    if not to_fold:
+        return False
+
+    response = summary_llm.invoke([
+        HumanMessage(content=SUMMARY_PROMPT.format(
+            max_words=SUMMARY_MAX_WORDS,
+            summary=chat.get("history_summary") or "(none yet)",
+            messages=format_transcript(to_fold)
+        ))
+    ])
+
+    stored = supabase.rpc("update_chat_summary", {
+        "p_chat_id": chat_id,
+        "p_summary": response.content.strip(),
+        "p_summarized_until": to_fold[-1]["created_at"],
+        "p_previous_until": chat.get("summarized_until"),
+    }).execute()
+    print(f"🧾 Folded {len(to_fold)} messages into the summary of chat {chat_id}")
+    return bool(stored.data)
@@ -0,0 +1,169 @@
+from dotenv import load_dotenv
+import html
+import os
+import re
+
+
+load_dotenv()
+
+# Token budget of the packed context per unit of the project's final_context_size
+CONTEXT_TOKENS_PER_CHUNK = int(os.getenv("CONTEXT_TOKENS_PER_CHUNK", "600"))
+
+# Hard ceiling on the packed context whatever final_context_size says
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "8000"))
+
+# Chunks sharing at least this fraction of their word shingles with an already
+# packed chunk are dropped as near-duplicates / overlaps
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+
+# Smallest slice of a chunk worth keeping when it has to be truncated to fit
+CONTEXT_MIN_CHUNK_TOKENS = int(os.getenv("CONTEXT_MIN_CHUNK_TOKENS", "50"))
+
+SHINGLE_SIZE = 5
+
+WORD_PATTERN = re.compile(r"\w+")
+TAG_PATTERN = re.compile(r"<[^>]+>")
+# Inline image payloads (data URIs and long bare base64 runs) never go into a prompt
+IMAGE_PAYLOAD_PATTERN = re.compile(r"data:image/[\w.+-]+;base64,[A-Za-z0-9+/=\s]+|[A-Za-z0-9+/]{200,}={0,2}")
+
+try:
+    import tiktoken
+    encoding = tiktoken.get_encoding("cl100k_base")
+except Exception as e:
+    print(f"⚠️ tiktoken unavailable, estimating token counts from characters: {e}")
+    encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken, or a ~4 characters per token estimate without it"""
+    if not text:
+        return 0
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def strip_image_payloads(text: str) -> str:
+    return IMAGE_PAYLOAD_PATTERN.sub("[image omitted]", text)
+
+
+def table_to_text(table_html: str) -> str:
+    """Flatten table HTML to pipe-separated rows, which costs far fewer tokens than the markup"""
+    text = re.sub(r"</t[dh]>", " | ", table_html, flags=re.IGNORECASE)
+    text = re.sub(r"</tr>", "\n", text, flags=re.IGNORECASE)
+    text = html.unescape(TAG_PATTERN.sub("", text))
+    return "\n".join(line.strip(" |") for line in text.splitlines() if line.strip(" |"))
+
+
+def chunk_text(chunk: dict) -> str:
+    """
+    Text of a chunk as it goes into the prompt.
+
+    `content` holds the AI summary for chunks with tables/images and the raw
+    text otherwise. For table chunks the raw text plus the flattened tables is
+    used instead when it is shorter than the summary. Images, and tables
+    moved to S3, only ever reach the prompt through the summary.
+    """
+    content = chunk.get("content") or ""
+    original = chunk.get("original_content") or {}
+    if isinstance(original, dict) and original.get("tables") and all(isinstance(table, str) for table in original["tables"]):
+        raw = "\n\n".join([original.get("text") or ""] + [table_to_text(table) for table in original["tables"]])
+        if raw.strip() and count_tokens(raw) < count_tokens(content):
+            content = raw
+    return strip_image_payloads(content).strip()
+
+
+def shingles(text: str) -> set:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def is_near_duplicate(candidate: set, packed: list) -> bool:
+    """Overlap relative to the smaller chunk, so a chunk contained in another counts too"""
+    if not candidate:
+        return True
+    for other in packed:
+        if other and len(candidate & other) / min(len(candidate), len(other)) >= CONTEXT_DUPLICATE_THRESHOLD:
+            return True
+    return False
+
+
+def context_budget(settings: dict) -> int:
+    return min(CONTEXT_MAX_TOKENS, int(settings["final_context_size"]) * CONTEXT_TOKENS_PER_CHUNK)
+
+
+def format_source(index: int, chunk: dict) -> str:
+    source = chunk.get("filename") or "document"
+    if chunk.get("page_number"):
+        source += f", page {chunk['page_number']}"
+    return f"[{index}] ({source})\n"
+
+
+def pack_context(chunks: list, settings: dict) -> tuple:
+    """
+    Pack retrieved candidates (best first) into a numbered context of at
+    most final_context_size chunks within the token budget derived from it.
+
+    Near-duplicate and overlapping chunks are skipped, chunks that don't fit
+    are skipped in favour of smaller ones further down, and only the best
+    chunk is ever truncated so the context is never empty. Skipped chunks
+    are replaced from the rest of the candidates.
+
+    Returns (context, packed_chunks, metrics); packed_chunks are numbered
+    [1..n] in the context, in order, so citations can be built from them.
+    """
+    budget = context_budget(settings)
+    max_chunks = int(settings["final_context_size"])
+    sections = []
+    packed_chunks = []
+    packed_shingles = []
+    used = 0
+    dropped_duplicates = 0
+    dropped_budget = 0
+    truncated = 0
+
+    for chunk in chunks:
+        if len(packed_chunks) >= max_chunks:
+            break
+        text = chunk_text(chunk)
+        chunk_shingles = shingles(text)
+        if is_near_duplicate(chunk_shingles, packed_shingles):
+            dropped_duplicates += 1
+            continue
+
+        header = format_source(len(packed_chunks) + 1, chunk)
+        # Sections are joined with a blank line, roughly one token each
+        section_tokens = count_tokens(header) + count_tokens(text) + 1
+        if used + section_tokens > budget:
+            remaining = budget - used - count_tokens(header) - 1
+            if packed_chunks or remaining < CONTEXT_MIN_CHUNK_TOKENS:
+                dropped_budget += 1
+                continue
+            text = truncate_to_tokens(text, remaining)
+            section_tokens = count_tokens(header) + count_tokens(text) + 1
+            truncated += 1
+
+        sections.append(header + text)
+        packed_chunks.append(chunk)
+        packed_shingles.append(chunk_shingles)
+        used += section_tokens
+
+    context = "\n\n".join(sections)
+    metrics = {
+        "context_budget_tokens": budget,
+        "context_tokens": count_tokens(context),
+        "context_chunks": len(packed_chunks),
+        "candidate_chunks": len(chunks),
+        "dropped_duplicates": dropped_duplicates,
+        "dropped_over_budget": dropped_budget,
+        "truncated_chunks": truncated,
+    }
+    return context, packed_chunks, metrics
@@ -0,0 +1,179 @@
+from array import array
+from services.cache_service import MemoryLRUCache, RedisCache, build_cache
+from dotenv import load_dotenv
+import hashlib
+import os
+import threading
+import time
+
+
+load_dotenv()
+
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", str(24 * 3600)))
+# Share query embeddings between API processes through Redis (CACHE_REDIS_URL)
+QUERY_EMBEDDING_CACHE_REDIS = os.getenv("QUERY_EMBEDDING_CACHE_REDIS", "false").lower() == "true"
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of document embeddings.
+
+    Keys are (model, dimensions, sha256 of the text), so the same text embedded
+    by the same model is only ever sent to the provider once. Vectors are stored
+    as float32, the same precision pgvector keeps them in.
+    """
+
+    def __init__(self, model: str, dimensions: int, cache=None):
+        self.model = model
+        self.dimensions = dimensions
+        self.cache = cache
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model}:{self.dimensions}:{digest}"
+
+    def get_many(self, texts: list) -> list:
+        """Return a cached vector (or None) for each text, in order."""
+        if self.cache is None:
+            return [None] * len(texts)
+
+        keys = [self._key(text) for text in texts]
+        try:
+            found = self.cache.get_many(list(set(keys)))
+        except Exception as e:
+            print(f"⚠️ Embedding cache read failed: {e}")
+            return [None] * len(texts)
+
+        return [
+            array("f", found[key]).tolist() if key in found else None
+            for key in keys
+        ]
+
+    def set_many(self, texts: list, vectors: list):
+        if self.cache is None:
+            return
+
+        try:
+            self.cache.set_many({
+                self._key(text): array("f", vector).tobytes()
+                for text, vector in zip(texts, vectors)
+            })
+        except Exception as e:
+            print(f"⚠️ Embedding cache write failed: {e}")
+
+
+def build_embedding_cache(model: str, dimensions: int) -> EmbeddingCache:
+    return EmbeddingCache(
+        model,
+        dimensions,
+        build_cache("embeddings", max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+    )
+
+
+class QueryEmbeddingCache:
+    """
+    Two-tier cache for chat query embeddings.
+
+    An in-process LRU/TTL tier answers repeats from the same API process and an
+    optional Redis tier shares them between processes. Keys are the model,
+    dimensions and the query normalised for case and whitespace, so trivially
+    different phrasings of the same question hit the same entry.
+    """
+
+    def __init__(self, model: str, dimensions: int, memory: MemoryLRUCache, shared=None):
+        self.model = model
+        self.dimensions = dimensions
+        self.memory = memory
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "miss_ms_total": 0.0}
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(self.normalize(text).encode("utf-8")).hexdigest()
+        return f"{self.model}:{self.dimensions}:{digest}"
+
+    def embed(self, texts: list, embed_fn) -> tuple:
+        """
+        Return (vectors, hits) for `texts`, calling `embed_fn` (a batched
+        embed_documents) only for the texts found in neither tier.
+        """
+        keys = [self._key(text) for text in texts]
+        vectors = [self.memory.get(key) for key in keys]
+        memory_hits = sum(1 for vector in vectors if vector is not None)
+
+        shared_hits = 0
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing and self.shared is not None:
+            try:
+                found = self.shared.get_many([keys[i] for i in missing])
+            except Exception as e:
+                print(f"⚠️ Shared query embedding cache read failed: {e}")
+                found = {}
+            for i in missing:
+                if keys[i] in found:
+                    vectors[i] = array("f", found[keys[i]]).tolist()
+                    self.memory.set(keys[i], vectors[i])
+                    shared_hits += 1
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        miss_ms = 0.0
+        if missing:
+            started = time.perf_counter()
+            embedded = embed_fn([texts[i] for i in missing])
+            miss_ms = (time.perf_counter() - started) * 1000
+
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+                self.memory.set(keys[i], vector)
+            if self.shared is not None:
+                try:
+                    self.shared.set_many({keys[i]: array("f", vectors[i]).tobytes() for i in missing})
+                except Exception as e:
+                    print(f"⚠️ Shared query embedding cache write failed: {e}")
+
+        with self._lock:
+            self._stats["memory_hits"] += memory_hits
+            self._stats["shared_hits"] += shared_hits
+            self._stats["misses"] += len(missing)
+            self._stats["miss_ms_total"] += miss_ms
+
+        return vectors, memory_hits + shared_hits
+
+    def stats(self) -> dict:
+        """Hit rates and the API time saved, estimated from the average miss latency"""
+        with self._lock:
+            stats = dict(self._stats)
+
+        hits = stats["memory_hits"] + stats["shared_hits"]
+        lookups = hits + stats["misses"]
+        average_miss_ms = stats["miss_ms_total"] / stats["misses"] if stats["misses"] else 0.0
+        return {
+            "lookups": lookups,
+            "memory_hits": stats["memory_hits"],
+            "shared_hits": stats["shared_hits"],
+            "misses": stats["misses"],
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "average_miss_ms": round(average_miss_ms, 1),
+            "estimated_saved_ms": round(hits * average_miss_ms, 1),
+            "memory_entries": len(self.memory),
+        }
+
+
+def build_query_embedding_cache(model: str, dimensions: int) -> QueryEmbeddingCache:
+    shared = None
+    if QUERY_EMBEDDING_CACHE_REDIS:
+        shared = RedisCache("query-embeddings", ttl=QUERY_EMBEDDING_CACHE_TTL)
+
+    return QueryEmbeddingCache(
+        model,
+        dimensions,
+        MemoryLRUCache(max_entries=QUERY_EMBEDDING_CACHE_SIZE, ttl=QUERY_EMBEDDING_CACHE_TTL),
+        shared
+    )
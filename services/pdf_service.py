@@ -0,0 +1,230 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+from pypdf import PdfReader, PdfWriter
+from unstructured.partition.pdf import partition_pdf
+from unstructured.staging.base import elements_from_dicts, elements_to_dicts
+import multiprocessing
+import os
+import re
+import threading
+
+
+load_dotenv()
+
+# "adaptive" routes each page to the cheapest strategy that can handle it;
+# "hi_res" runs layout detection on every page
+PDF_PARTITION_MODE = os.getenv("PDF_PARTITION_MODE", "adaptive")
+
+# Pages with less extractable text than this are treated as scans and need OCR
+PDF_MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", "200"))
+
+# Embedded images smaller than this many pixels (logos, bullets, rules) are ignored
+PDF_MIN_IMAGE_PIXELS = int(os.getenv("PDF_MIN_IMAGE_PIXELS", "40000"))
+
+# Share of lines that look like table rows before a page counts as tabular
+PDF_TABLE_LINE_RATIO = float(os.getenv("PDF_TABLE_LINE_RATIO", "0.3"))
+
+# PDFs with at least this many pages are partitioned as page ranges in a process pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+PDF_PAGE_RANGE_SIZE = int(os.getenv("PDF_PAGE_RANGE_SIZE", "20"))
+PDF_PARTITION_WORKERS = int(os.getenv("PDF_PARTITION_WORKERS", str(os.cpu_count() or 1)))
+
+HI_RES_OPTIONS = {
+    "strategy": "hi_res", # Use the most accurate (but slower) processing method of extraction
+    "infer_table_structure": True, # Keep tables as structured HTML, not jumbled text
+    "extract_image_block_types": ["Image"], # Grab images found in the PDF
+    "extract_image_block_to_payload": True # Store images as base64 data you can actually use
+}
+
+FAST_OPTIONS = {
+    "strategy": "fast" # Read the embedded text layer directly
+}
+
+NUMBER_PATTERN = re.compile(r"^[\(\-\$€£]?\d[\d,\.]*%?\)?$")
+
+_partition_pool = None
+_partition_pool_lock = threading.Lock()
+
+
+def has_large_images(page) -> bool:
+    """True if the page draws an image big enough to be a figure or a scan"""
+    resources = page.get("/Resources")
+    if not resources:
+        return False
+
+    xobjects = resources.get_object().get("/XObject")
+    if not xobjects:
+        return False
+
+    for xobject in xobjects.get_object().values():
+        xobject = xobject.get_object()
+        if xobject.get("/Subtype") != "/Image":
+            continue
+        if int(xobject.get("/Width", 0)) * int(xobject.get("/Height", 0)) >= PDF_MIN_IMAGE_PIXELS:
+            return True
+    return False
+
+
+def looks_tabular(text: str) -> bool:
+    """Cheap table detector: many lines carrying three or more numeric cells"""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return False
+
+    table_lines = sum(
+        1 for line in lines
+        if sum(1 for token in line.split() if NUMBER_PATTERN.match(token)) >= 3
+    )
+    return table_lines >= 3 and table_lines / len(lines) >= PDF_TABLE_LINE_RATIO
+
+
+def choose_page_strategy(page) -> str:
+    """Route a page to "fast" if its text layer is enough, otherwise "hi_res"."""
+    try:
+        text = page.extract_text() or ""
+    except Exception:
+        return "hi_res"
+
+    if len(text.strip()) < PDF_MIN_TEXT_CHARS:
+        return "hi_res"  # scanned or figure-only page: needs OCR / layout detection
+    if has_large_images(page) or looks_tabular(text):
+        return "hi_res"
+    return "fast"
+
+
+def plan_page_runs(strategies: list) -> list:
+    """Group consecutive pages with the same strategy into (strategy, first_page, last_page) runs"""
+    runs = []
+    for page_number, strategy in enumerate(strategies, start=1):
+        if runs and runs[-1][0] == strategy:
+            runs[-1] = (strategy, runs[-1][1], page_number)
+        else:
+            runs.append((strategy, page_number, page_number))
+    return runs
+
+
+def write_page_range(reader: PdfReader, first_page: int, last_page: int, path: str) -> str:
+    """Write pages first_page..last_page (1-based, inclusive) to a new PDF at `path`"""
+    writer = PdfWriter()
+    for index in range(first_page - 1, last_page):
+        writer.add_page(reader.pages[index])
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+
+def partition_pdf_hi_res(source):
+    source_args = {"filename": source} if isinstance(source, str) else {"file": source}
+    return partition_pdf(**source_args, **HI_RES_OPTIONS)
+
+
+def split_runs(runs: list, range_size: int) -> list:
+    """Split strategy runs into page ranges of at most `range_size` pages"""
+    ranges = []
+    for strategy, first_page, last_page in runs:
+        for start in range(first_page, last_page + 1, range_size):
+            ranges.append((strategy, start, min(start + range_size - 1, last_page)))
+    return ranges
+
+
+def partition_page_range(range_path: str, strategy: str, first_page: int) -> list:
+    """Partition one page-range PDF; runs in a pool process, so elements go back as dicts"""
+    options = FAST_OPTIONS if strategy == "fast" else HI_RES_OPTIONS
+    elements = partition_pdf(
+        filename=range_path,
+        starting_page_number=first_page, # Keep page numbers relative to the full document
+        **options
+    )
+    return elements_to_dicts(elements)
+
+
+def get_partition_pool():
+    """Lazily start the shared process pool (reused across documents so models load once per process)"""
+    global _partition_pool
+    with _partition_pool_lock:
+        if _partition_pool is None:
+            _partition_pool = ProcessPoolExecutor(
+                max_workers=PDF_PARTITION_WORKERS,
+                # spawn: forking a threaded Celery worker can deadlock the children
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _partition_pool
+
+
+def reset_partition_pool():
+    global _partition_pool
+    with _partition_pool_lock:
+        if _partition_pool is not None:
+            _partition_pool.shutdown(wait=False, cancel_futures=True)
+            _partition_pool = None
+
+
+def partition_page_ranges(reader: PdfReader, ranges: list, workspace: str, parallel: bool) -> list:
+    """Partition each page range into its own sub-PDF and stitch the elements back in page order"""
+    range_jobs = []
+    for strategy, first_page, last_page in ranges:
+        range_path = write_page_range(
+            reader, first_page, last_page,
+            os.path.join(workspace, f"pages-{first_page}-{last_page}.pdf")
+        )
+        range_jobs.append((range_path, strategy, first_page))
+
+    # Daemonic processes (e.g. Celery prefork children) can't start a pool of their own
+    if parallel and multiprocessing.current_process().daemon:
+        print("⚠️ Running inside a daemonic process, partitioning page ranges sequentially")
+        parallel = False
+
+    if parallel:
+        try:
+            pool = get_partition_pool()
+            futures = [pool.submit(partition_page_range, *job) for job in range_jobs]
+            results = [future.result() for future in futures]
+        except (AssertionError, BrokenProcessPool) as e:
+            print(f"⚠️ Partition pool unavailable ({e}), partitioning page ranges sequentially")
+            reset_partition_pool()
+            results = [partition_page_range(*job) for job in range_jobs]
+    else:
+        results = [partition_page_range(*job) for job in range_jobs]
+
+    elements = []
+    for element_dicts in results:
+        elements.extend(elements_from_dicts(element_dicts))
+    return elements
+
+
+def partition_pdf_document(source, workspace: str):
+    """
+    Partition a PDF, choosing per page how and where to do the work.
+
+    In adaptive mode every page is inspected through its text layer; born-digital
+    prose goes through the fast extractor and only scans, tables and figures are
+    sent to hi_res. Documents of PDF_PARALLEL_MIN_PAGES pages or more are split
+    into ranges of at most PDF_PAGE_RANGE_SIZE pages that are partitioned in a
+    process pool. Either way the elements come back in page order with page
+    numbers relative to the full document.
+    """
+    reader = PdfReader(source)
+    page_count = len(reader.pages)
+
+    if PDF_PARTITION_MODE == "adaptive":
+        strategies = [choose_page_strategy(page) for page in reader.pages]
+        print(f"📄 PDF routing: {strategies.count('fast')} fast pages, {strategies.count('hi_res')} hi_res pages")
+    else:
+        strategies = ["hi_res"] * page_count
+    runs = plan_page_runs(strategies)
+
+    parallel = PDF_PARTITION_WORKERS > 1 and page_count >= PDF_PARALLEL_MIN_PAGES
+    if parallel:
+        ranges = split_runs(runs, PDF_PAGE_RANGE_SIZE)
+        print(f"📄 Partitioning {page_count} pages as {len(ranges)} ranges on {PDF_PARTITION_WORKERS} processes")
+        return partition_page_ranges(reader, ranges, workspace, parallel=True)
+
+    if len(runs) <= 1:
+        if not isinstance(source, str):
+            source.seek(0)
+        source_args = {"filename": source} if isinstance(source, str) else {"file": source}
+        options = FAST_OPTIONS if runs and runs[0][0] == "fast" else HI_RES_OPTIONS
+        return partition_pdf(**source_args, **options)
+
+    return partition_page_ranges(reader, runs, workspace, parallel=False)
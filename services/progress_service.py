@@ -0,0 +1,90 @@
+from database import supabase
+from dotenv import load_dotenv
+import os
+import threading
+import time
+
+
+load_dotenv()
+
+# Minimum seconds between progress writes within the same stage
+PROGRESS_FLUSH_INTERVAL = float(os.getenv("PROGRESS_FLUSH_INTERVAL", "2"))
+
+
+def write_progress(document_id: str, status: str = None, details: dict = None):
+    """Merge status/details into the document row in one round trip."""
+    supabase.rpc("update_document_progress", {
+        "p_document_id": document_id,
+        "p_status": status,
+        "p_details": details or {}
+    }).execute()
+
+
+class ProgressReporter:
+    """
+    Write-behind progress reporting for a single document.
+
+    Updates are merged in memory and flushed at most every `flush_interval`
+    seconds, or immediately when the status changes (a stage transition).
+    Each flush only sends the keys changed since the last one and the merge
+    happens in the database, so writers never read-modify-write.
+    """
+
+    def __init__(self, document_id: str, flush_interval: float = PROGRESS_FLUSH_INTERVAL):
+        self.document_id = document_id
+        self.flush_interval = flush_interval
+        self.status = None
+        self.details = {}
+        self._pending = {}
+        self._status_dirty = False
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, status: str = None, details: dict = None):
+        """Record a status and/or details update, flushing if one is due."""
+        with self._lock:
+            stage_changed = status is not None and status != self.status
+            if stage_changed:
+                self.status = status
+                self._status_dirty = True
+
+            if details:
+                self.details.update(details)
+                self._pending.update(details)
+
+            if stage_changed or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def flush(self):
+        """Write any pending updates now."""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self, status: str, details: dict = None):
+        """Final authoritative write: the last status plus every detail this reporter knows."""
+        with self._lock:
+            self.status = status
+            if details:
+                self.details.update(details)
+            write_progress(self.document_id, self.status, self.details)
+            self._pending = {}
+            self._status_dirty = False
+            self._last_flush = time.monotonic()
+
+    def _flush_locked(self):
+        if not self._pending and not self._status_dirty:
+            return
+
+        try:
+            write_progress(
+                self.document_id,
+                self.status if self._status_dirty else None,
+                self._pending
+            )
+            self._pending = {}
+            self._status_dirty = False
+        except Exception as e:
+            # Progress is best effort; keep the pending updates for the next flush
+            print(f"⚠️ Failed to write progress for {self.document_id}: {e}")
+        finally:
+            self._last_flush = time.monotonic()
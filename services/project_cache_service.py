@@ -0,0 +1,100 @@
+from contextvars import ContextVar
+from database import supabase, async_supabase
+from services.cache_service import MemoryLRUCache
+from dotenv import load_dotenv
+import os
+
+
+load_dotenv()
+
+# Process-wide TTL: bounds how long another API process can serve a stale value,
+# since explicit invalidation only reaches the process that made the change
+PROJECT_CACHE_TTL = float(os.getenv("PROJECT_CACHE_TTL", "30"))
+PROJECT_CACHE_MAX_ENTRIES = int(os.getenv("PROJECT_CACHE_MAX_ENTRIES", "10000"))
+
+# (project_id, clerk_id) -> True; only confirmed ownership is cached so a new project is usable at once
+ownership_cache = MemoryLRUCache(max_entries=PROJECT_CACHE_MAX_ENTRIES, ttl=PROJECT_CACHE_TTL)
+
+# project_id -> project_settings row (None when the project has none)
+settings_cache = MemoryLRUCache(max_entries=PROJECT_CACHE_MAX_ENTRIES, ttl=PROJECT_CACHE_TTL)
+
+# Per-request memo set up by the API middleware, so one request sees one value throughout
+request_cache: ContextVar = ContextVar("request_cache", default=None)
+
+MISSING = object()
+
+
+def start_request_scope():
+    return request_cache.set({})
+
+
+def end_request_scope(token):
+    request_cache.reset(token)
+
+
+def cache_get(cache: MemoryLRUCache, name: str, key):
+    scope = request_cache.get()
+    if scope is not None and (name, key) in scope:
+        return scope[(name, key)]
+
+    value = cache.get(key, MISSING)
+    if value is not MISSING and scope is not None:
+        scope[(name, key)] = value
+    return value
+
+
+def cache_set(cache: MemoryLRUCache, name: str, key, value):
+    cache.set(key, value)
+    scope = request_cache.get()
+    if scope is not None:
+        scope[(name, key)] = value
+
+
+def cache_delete(cache: MemoryLRUCache, name: str, key):
+    cache.delete(key)
+    scope = request_cache.get()
+    if scope is not None:
+        scope.pop((name, key), None)
+
+
+async def is_project_owner(project_id: str, clerk_id: str) -> bool:
+    """Whether the project exists and belongs to the user"""
+    key = (project_id, clerk_id)
+    if cache_get(ownership_cache, "ownership", key) is True:
+        return True
+
+    result = await async_supabase.table("projects").select("id").eq("id", project_id).eq("clerk_id", clerk_id).execute()
+    owned = bool(result.data)
+    if owned:
+        cache_set(ownership_cache, "ownership", key, True)
+    return owned
+
+
+def get_project_settings_row(project_id: str) -> dict:
+    """The project's settings row (a copy), or None. Sync, for services running in threads"""
+    row = cache_get(settings_cache, "settings", project_id)
+    if row is MISSING:
+        result = supabase.table("project_settings").select("*").eq("project_id", project_id).execute()
+        row = result.data[0] if result.data else None
+        cache_set(settings_cache, "settings", project_id, row)
+    return dict(row) if row else None
+
+
+async def get_project_settings_row_async(project_id: str) -> dict:
+    """Same as get_project_settings_row, for async route handlers"""
+    row = cache_get(settings_cache, "settings", project_id)
+    if row is MISSING:
+        result = await async_supabase.table("project_settings").select("*").eq("project_id", project_id).execute()
+        row = result.data[0] if result.data else None
+        cache_set(settings_cache, "settings", project_id, row)
+    return dict(row) if row else None
+
+
+def invalidate_project_settings(project_id: str):
+    cache_delete(settings_cache, "settings", project_id)
+
+
+def invalidate_project(project_id: str, clerk_id: str):
+    """Forget everything cached about a project (e.g. once it is deleted)"""
+    cache_delete(ownership_cache, "ownership", (project_id, clerk_id))
+    invalidate_project_settings(project_id)
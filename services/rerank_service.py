@@ -0,0 +1,175 @@
+from services.cache_service import MemoryLRUCache
+from dotenv import load_dotenv
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+
+
+load_dotenv()
+
+# Characters of each candidate sent to the reranker
+RERANK_MAX_CHARS = int(os.getenv("RERANK_MAX_CHARS", "2000"))
+
+# Local cross-encoder used when the project's reranking_model can't be loaded locally
+RERANKER_DEFAULT_MODEL = os.getenv("RERANKER_DEFAULT_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+LEXICAL_MODEL = "lexical"
+
+# A model that failed to load is retried after this long rather than on every query
+RERANKER_RETRY_INTERVAL = float(os.getenv("RERANKER_RETRY_INTERVAL", "600"))
+
+score_cache = MemoryLRUCache(
+    max_entries=int(os.getenv("RERANK_CACHE_MAX_ENTRIES", "50000")),
+    ttl=float(os.getenv("RERANK_CACHE_TTL", "3600"))
+)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class LexicalReranker:
+    """
+    Deterministic BM25 reranker over the candidate set.
+
+    Needs no model download, so it serves as the stand-in for tests and for
+    projects whose reranking_model is explicitly "lexical". IDF and average
+    length come from the texts passed in, so scores are only comparable
+    within one call and are never cached.
+    """
+
+    name = LEXICAL_MODEL
+    cacheable = False
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    def score(self, query: str, texts: list) -> list:
+        query_terms = set(TOKEN_PATTERN.findall(query.lower()))
+        documents = [TOKEN_PATTERN.findall(text.lower()) for text in texts]
+        if not documents:
+            return []
+
+        average_length = sum(len(doc) for doc in documents) / len(documents) or 1
+        document_frequency = {
+            term: sum(1 for doc in documents if term in doc) for term in query_terms
+        }
+
+        scores = []
+        for doc in documents:
+            term_counts = {}
+            for token in doc:
+                if token in query_terms:
+                    term_counts[token] = term_counts.get(token, 0) + 1
+
+            score = 0.0
+            for term, count in term_counts.items():
+                idf = math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                norm = count + self.k1 * (1 - self.b + self.b * len(doc) / average_length)
+                score += idf * count * (self.k1 + 1) / norm
+            scores.append(score)
+        return scores
+
+
+class CrossEncoderReranker:
+    """Local CPU cross-encoder (requires the optional sentence-transformers package)"""
+
+    # A (query, text) score depends on the model alone, so it can be cached
+    cacheable = True
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import CrossEncoder
+
+        self.name = model_name
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def score(self, query: str, texts: list) -> list:
+        if not texts:
+            return []
+        return [float(score) for score in self.model.predict([(query, text) for text in texts])]
+
+
+_rerankers = {}
+_rerankers_lock = threading.Lock()
+
+
+def get_reranker(model_name: str):
+    """
+    Resolve a reranking_model setting to a loaded reranker (cached per name).
+
+    "lexical" selects the BM25 reranker. Anything else is tried as a local
+    cross-encoder, then RERANKER_DEFAULT_MODEL. Returns None when neither
+    loads; that outcome is remembered for RERANKER_RETRY_INTERVAL seconds.
+    """
+    with _rerankers_lock:
+        entry = _rerankers.get(model_name)
+        if entry is not None and (entry[0] is not None or time.monotonic() - entry[1] < RERANKER_RETRY_INTERVAL):
+            return entry[0]
+
+        reranker = None
+        if model_name == LEXICAL_MODEL:
+            reranker = LexicalReranker()
+        else:
+            for candidate in (model_name, RERANKER_DEFAULT_MODEL):
+                try:
+                    reranker = CrossEncoderReranker(candidate)
+                    break
+                except Exception as e:
+                    print(f"⚠️ Could not load reranker '{candidate}': {e}")
+            if reranker is None:
+                print(f"⚠️ No cross-encoder available for '{model_name}', keeping the retrieval order")
+
+        _rerankers[model_name] = (reranker, time.monotonic())
+        return reranker
+
+
+def rerank(query: str, chunks: list, model_name: str, top_n: int) -> tuple:
+    """
+    Score every candidate against the query in one batched call and keep the best `top_n`.
+
+    Cross-encoder scores are cached per (model, query, chunk id), so only
+    unseen pairs reach the model. Lexical scores depend on the whole
+    candidate set and are always computed for all candidates together.
+    Without a usable reranker the retrieval order is kept.
+    Returns (chunks, metrics).
+    """
+    started = time.perf_counter()
+    reranker = get_reranker(model_name)
+    if reranker is None:
+        return chunks[:top_n], {
+            "rerank_model": None,
+            "rerank_skipped": f"reranker '{model_name}' unavailable",
+        }
+    query_hash = hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+    scores = {}
+    misses = []
+    for chunk in chunks:
+        cached = score_cache.get((reranker.name, query_hash, chunk["id"])) if reranker.cacheable else None
+        if cached is None:
+            misses.append(chunk)
+        else:
+            scores[chunk["id"]] = cached
+
+    if misses:
+        texts = [chunk["content"][:RERANK_MAX_CHARS] for chunk in misses]
+        for chunk, score in zip(misses, reranker.score(query, texts)):
+            scores[chunk["id"]] = score
+            if reranker.cacheable:
+                score_cache.set((reranker.name, query_hash, chunk["id"]), score)
+
+    reranked = sorted(
+        ({**chunk, "rerank_score": scores[chunk["id"]]} for chunk in chunks),
+        key=lambda chunk: chunk["rerank_score"],
+        reverse=True
+    )[:top_n]
+
+    metrics = {
+        "rerank_ms": round((time.perf_counter() - started) * 1000, 1),
+        "rerank_model": reranker.name,
+        "rerank_candidates": len(chunks),
+        "rerank_cache_hits": len(chunks) - len(misses),
+    }
+    return reranked, metrics
@@ -0,0 +1,228 @@
+from concurrent.futures import ThreadPoolExecutor
+from database import supabase
+from services.rerank_service import rerank
+from services.embedding_cache import build_query_embedding_cache
+from services.vector_index_service import VECTOR_INDEX_ENABLED, search_index
+from services.project_cache_service import get_project_settings_row
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from dotenv import load_dotenv
+import os
+import re
+import time
+
+
+load_dotenv()
+
+# Must match the model/dimensions the chunks were embedded with in tasks.py
+embeddings_model = OpenAIEmbeddings(
+    model="text-embedding-3-large",
+    dimensions=1536,
+    openai_api_base="https://openrouter.ai/api/v1",
+    openai_api_key=os.getenv("OPENROUTER_API_KEY")
+)
+
+query_embedding_cache = build_query_embedding_cache(embeddings_model.model, embeddings_model.dimensions)
+
+# Generates the query rewrites for the multi-query strategies
+rewrite_llm = ChatOpenAI(
+    model=os.getenv("QUERY_REWRITE_MODEL", "gpt-4-turbo"),
+    temperature=0,
+    openai_api_base="https://openrouter.ai/api/v1",
+    openai_api_key=os.getenv("OPENROUTER_API_KEY")
+)
+
+# Upper bound on searches running at once across all multi-query requests
+MULTI_QUERY_CONCURRENCY = int(os.getenv("MULTI_QUERY_CONCURRENCY", "16"))
+search_executor = ThreadPoolExecutor(max_workers=MULTI_QUERY_CONCURRENCY)
+
+REWRITE_PROMPT = """Write {count} different rephrasings of the question below for searching a document collection.
+Vary the wording and use likely synonyms or related terms; keep the meaning the same.
+Return one rephrasing per line with no numbering or extra text.
+
+QUESTION: {question}"""
+
+# Fusion used by hybrid search: "rrf" (reciprocal rank) or "weighted" (score)
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf")
+
+DEFAULT_RETRIEVAL_SETTINGS = {
+    "rag_strategy": "basic",
+    "number_of_queries": 5,
+    "chunks_per_search": 10,
+    "final_context_size": 5,
+    "similarity_threshold": 0.3,
+    "reranking_enabled": False,
+    "reranking_model": "lexical",
+    "vector_weight": 0.7,
+    "keyword_weight": 0.3,
+}
+
+
+def get_project_settings(project_id: str) -> dict:
+    """Load the project's RAG settings, falling back to the defaults for missing values"""
+    row = get_project_settings_row(project_id)
+    settings = dict(DEFAULT_RETRIEVAL_SETTINGS)
+    if row:
+        settings.update({key: value for key, value in row.items() if value is not None})
+    return settings
+
+
+def vector_search(project_id: str, query_embedding: list, settings: dict) -> list:
+    """Top-k chunks of the project by similarity, in a single RPC round trip"""
+    if VECTOR_INDEX_ENABLED:
+        # Small projects are scored in-process; stale or missing indexes fall through to the database
+        chunks = search_index(project_id, query_embedding, settings)
+        if chunks is not None:
+            return chunks
+    
+    result = supabase.rpc("match_document_chunks", {
+        "query_embedding": query_embedding,
+        "p_project_id": project_id,
+        "match_count": int(settings["chunks_per_search"]),
+        "similarity_threshold": float(settings["similarity_threshold"]),
+    }).execute()
+    chunks = result.data or []
+    for chunk in chunks:
+        chunk["score"] = chunk["similarity"]
+    return chunks
+
+
+def hybrid_search(project_id: str, query: str, query_embedding: list, settings: dict) -> list:
+    """Vector and full-text candidates fused in the database with the project's weights"""
+    result = supabase.rpc("hybrid_search_document_chunks", {
+        "query_text": query,
+        "query_embedding": query_embedding,
+        "p_project_id": project_id,
+        "match_count": int(settings["chunks_per_search"]),
+        "similarity_threshold": float(settings["similarity_threshold"]),
+        "vector_weight": float(settings["vector_weight"]),
+        "keyword_weight": float(settings["keyword_weight"]),
+        "fusion": HYBRID_FUSION,
+    }).execute()
+    return result.data or []
+
+
+def search(project_id: str, query: str, query_embedding: list, settings: dict) -> list:
+    """Run the search mode selected by the project's rag_strategy"""
+    if settings["rag_strategy"] in ("hybrid", "multi-query-hybrid"):
+        return hybrid_search(project_id, query, query_embedding, settings)
+    return vector_search(project_id, query_embedding, settings)
+
+
+def embed_query(query: str) -> list:
+    """Embed a single query through the query embedding cache"""
+    vectors, _ = query_embedding_cache.embed([query], embeddings_model.embed_documents)
+    return vectors[0]
+
+
+def generate_query_rewrites(query: str, count: int) -> list:
+    """Ask the LLM for `count` rephrasings of the query in a single call"""
+    if count <= 0:
+        return []
+
+    try:
+        response = rewrite_llm.invoke([
+            HumanMessage(content=REWRITE_PROMPT.format(count=count, question=query))
+        ])
+    except Exception as e:
+        print(f"⚠️ Query rewrite failed, searching with the original query only: {e}")
+        return []
+
+    rewrites = []
+    for line in response.content.splitlines():
+        # Models sometimes number or bullet the lines anyway
+        line = re.sub(r"^\s*(\d+[\.\)]|[-*•])\s*", "", line).strip()
+        if line and line.lower() != query.lower() and line not in rewrites:
+            rewrites.append(line)
+    return rewrites[:count]
+
+
+def merge_results(result_lists: list) -> list:
+    """Deduplicate chunks found by several queries, keeping each chunk's best score"""
+    merged = {}
+    for results in result_lists:
+        for chunk in results:
+            existing = merged.get(chunk["id"])
+            if existing is None:
+                merged[chunk["id"]] = {**chunk, "query_hits": 1}
+            else:
+                existing["query_hits"] += 1
+                if (chunk["score"] or 0) > (existing["score"] or 0):
+                    merged[chunk["id"]] = {**chunk, "query_hits": existing["query_hits"]}
+
+    return sorted(merged.values(), key=lambda chunk: (chunk["score"] or 0, chunk["query_hits"]), reverse=True)
+
+
+def retrieve_chunks(project_id: str, query: str, settings: dict) -> tuple:
+    """
+    Embed the query and fetch the most relevant chunks of the project.
+
+    Multi-query strategies search with the original question plus
+    number_of_queries - 1 LLM rewrites: all queries are embedded in one
+    batched call and searched concurrently, and the results are merged by
+    chunk id.
+
+    With reranking enabled, all candidates are rescored by the project's
+    reranking_model.
+
+    Returns (chunks, metrics): up to chunks_per_search candidates ordered
+    best first. The cut to final_context_size is left to pack_context, so
+    chunks it drops as duplicates or over budget are replaced from further
+    down the list.
+    """
+    started = time.perf_counter()
+
+    queries = [query]
+    if settings["rag_strategy"].startswith("multi-query"):
+        queries += generate_query_rewrites(query, int(settings["number_of_queries"]) - 1)
+    rewritten = time.perf_counter()
+
+    # Repeated questions skip the embedding API; misses are embedded in one batched call
+    query_embeddings, embedding_cache_hits = query_embedding_cache.embed(queries, embeddings_model.embed_documents)
+    embedded = time.perf_counter()
+
+    if len(queries) == 1:
+        chunks = search(project_id, query, query_embeddings[0], settings)
+    else:
+        futures = [
+            search_executor.submit(search, project_id, text, embedding, settings)
+            for text, embedding in zip(queries, query_embeddings)
+        ]
+        chunks = merge_results([future.result() for future in futures])
+    searched = time.perf_counter()
+
+    # Merged multi-query results can hold several searches' worth of chunks
+    chunks = chunks[:int(settings["chunks_per_search"])]
+
+    rerank_metrics = {}
+    if settings["reranking_enabled"] and chunks:
+        chunks, rerank_metrics = rerank(
+            query, chunks, settings["reranking_model"], len(chunks)
+        )
+
+    metrics = {
+        "rewrite_ms": round((rewritten - started) * 1000, 1),
+        "embedding_ms": round((embedded - rewritten) * 1000, 1),
+        "search_ms": round((searched - embedded) * 1000, 1),
+        "strategy": settings["rag_strategy"],
+        "queries": len(queries),
+        "embedding_cache_hits": embedding_cache_hits,
+        "candidates": len(chunks),
+        **rerank_metrics,
+    }
+    return chunks, metrics
+
+
+def build_citations(chunks: list) -> list:
+    return [
+        {
+            "index": i,
+            "chunk_id": chunk["id"],
+            "document_id": chunk["document_id"],
+            "filename": chunk.get("filename"),
+            "page_number": chunk.get("page_number"),
+            "similarity": chunk.get("similarity"),
+            "score": chunk.get("score"),
+        }
+        for i, chunk in enumerate(chunks, start=1)
+    ]
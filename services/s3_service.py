@@ -1,4 +1,5 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 from botocore.config import Config
@@ -9,6 +10,16 @@ import tempfile
 
 load_dotenv()
 
+MB = 1024 * 1024
+
+# Objects up to this size are downloaded into a spooled in-memory buffer
+S3_SPOOL_MAX_SIZE = int(os.getenv("S3_SPOOL_MAX_SIZE", str(16 * MB)))
+
+# Objects above the threshold are fetched as parallel ranged GETs
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(8 * MB)))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE", str(8 * MB)))
+S3_DOWNLOAD_CONCURRENCY = int(os.getenv("S3_DOWNLOAD_CONCURRENCY", "10"))
+
 class S3Service:
     def __init__(self):
         self.s3_client = boto3.client(
@@ -16,12 +27,20 @@ class S3Service:
             aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
             aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
             region_name=os.getenv('AWS_REGION'),
+            # Point at a local S3 stand-in (MinIO, moto server, ...) when set
+            endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
             config=Config(
-                s3={'addressing_style': 'virtual'},
+                s3={'addressing_style': os.getenv('S3_ADDRESSING_STYLE', 'virtual')},
                 signature_version='s3v4'
             )
         )
         self.bucket_name = os.getenv('S3_BUCKET_NAME')
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=S3_DOWNLOAD_CONCURRENCY,
+            use_threads=True
+        )
        
 
     def generate_upload_url(self, file_name: str, file_type: str, project_id: str, expires_in: int = 3600) -> dict:
@@ -99,14 +118,90 @@ class S3Service:
             self.s3_client.download_file(
                 self.bucket_name,
                 file_key,
-                temp_file
+                temp_file,
+                Config=self.transfer_config
             )
             
             return temp_file
             
         except ClientError as e:
             raise Exception(f"Failed to download file: {str(e)}")
+
+    def get_object_fingerprint(self, file_key: str) -> str:
+        """Return the object's ETag, which changes whenever its content does."""
+        try:
+            response = self.s3_client.head_object(Bucket=self.bucket_name, Key=file_key)
+            return response['ETag'].strip('"')
+        except ClientError as e:
+            raise Exception(f"Failed to read file metadata: {str(e)}")
+
+    def download_document(self, file_key: str, file_name: str, workspace: str):
+        """
+        Download a file for processing.
+        
+        Args:
+            file_key: S3 object key
+            file_name: Name to save the file under when it goes to disk
+            workspace: Per-task directory for files too large to buffer in memory
+        
+        Returns:
+            A file-like object positioned at the start for small objects, or the
+            path of the downloaded file inside `workspace` for large ones
+        """
+        try:
+            size = self.s3_client.head_object(Bucket=self.bucket_name, Key=file_key)['ContentLength']
+            
+            if size <= S3_SPOOL_MAX_SIZE:
+                buffer = tempfile.SpooledTemporaryFile(max_size=S3_SPOOL_MAX_SIZE, dir=workspace)
+                self.s3_client.download_fileobj(
+                    self.bucket_name,
+                    file_key,
+                    buffer,
+                    Config=self.transfer_config
+                )
+                buffer.seek(0)
+                print(f"Downloaded {size} bytes into memory: {file_key}")
+                return buffer
+            
+            # Large objects: parallel ranged GETs straight into the workspace
+            file_path = os.path.join(workspace, os.path.basename(file_name))
+            self.s3_client.download_file(
+                self.bucket_name,
+                file_key,
+                file_path,
+                Config=self.transfer_config
+            )
+            print(f"Downloaded {size} bytes to: {file_path}")
+            return file_path
+            
+        except ClientError as e:
+            raise Exception(f"Failed to download file: {str(e)}")
     
+    def object_exists(self, file_key: str) -> bool:
+        """Whether an object exists under the key."""
+        try:
+            self.s3_client.head_object(Bucket=self.bucket_name, Key=file_key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise Exception(f"Failed to read file metadata: {str(e)}")
+
+    def upload_bytes(self, file_key: str, data: bytes, content_type: str, cache_control: str = None) -> str:
+        """Upload an in-memory object and return its key."""
+        try:
+            extra = {'CacheControl': cache_control} if cache_control else {}
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=file_key,
+                Body=data,
+                ContentType=content_type,
+                **extra
+            )
+            return file_key
+        except ClientError as e:
+            raise Exception(f"Failed to upload file: {str(e)}")
+
     def delete_file(self, file_key: str) -> bool:
         """Delete a file from S3."""
         try:
@@ -0,0 +1,71 @@
+from services.cache_service import build_cache
+from dotenv import load_dotenv
+import hashlib
+import json
+import os
+
+
+load_dotenv()
+
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "50000"))
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", str(30 * 24 * 3600)))
+
+
+class SummaryCache:
+    """
+    Cache of AI summaries keyed by everything that determines the output:
+    the chunk text, table HTML, image bytes, the model and the prompt.
+
+    `prompt_version` should change whenever the prompt does, which moves
+    every lookup onto a fresh set of keys.
+    """
+
+    def __init__(self, model: str, prompt_version: str, cache=None):
+        self.model = model
+        self.prompt_version = prompt_version
+        self.cache = cache
+
+    def _key(self, text: str, tables_html: list, images_base64: list) -> str:
+        payload = json.dumps({
+            "model": self.model,
+            "prompt": self.prompt_version,
+            "text": text,
+            "tables": tables_html,
+            "images": [hashlib.sha256(image.encode("utf-8")).hexdigest() for image in images_base64]
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, text: str, tables_html: list, images_base64: list):
+        if self.cache is None:
+            return None
+
+        key = self._key(text, tables_html, images_base64)
+        try:
+            value = self.cache.get_many([key]).get(key)
+        except Exception as e:
+            print(f"⚠️ Summary cache read failed: {e}")
+            return None
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, text: str, tables_html: list, images_base64: list, summary: str):
+        if self.cache is None:
+            return
+
+        try:
+            self.cache.set_many({self._key(text, tables_html, images_base64): summary.encode("utf-8")})
+        except Exception as e:
+            print(f"⚠️ Summary cache write failed: {e}")
+
+    def clear(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+
+def build_summary_cache(model: str, prompt_version: str, prompt_template: str) -> SummaryCache:
+    """Build the summary cache; the template's hash is folded into the prompt version."""
+    template_hash = hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()[:12]
+    return SummaryCache(
+        model,
+        f"{prompt_version}:{template_hash}",
+        build_cache("summaries", max_entries=SUMMARY_CACHE_MAX_ENTRIES, ttl=SUMMARY_CACHE_TTL)
+    )
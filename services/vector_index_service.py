@@ -0,0 +1,432 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from database import supabase
+from dotenv import load_dotenv
+import json
+import numpy as np
+import os
+import shutil
+import threading
+import time
+import uuid
+
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: the API must still start (the index is optional), so lock with msvcrt
+    fcntl = None
+    import msvcrt
+
+load_dotenv()
+
+# Off by default: projects are searched with match_document_chunks in Postgres
+VECTOR_INDEX_ENABLED = os.getenv("VECTOR_INDEX_ENABLED", "false").lower() == "true"
+
+# Must be one directory shared by the API and the Celery workers (e.g. a volume
+# mounted into every container), or ingestion's updates never reach the API's
+# index. No default: a per-process temp dir would silently serve stale vectors
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR")
+
+if VECTOR_INDEX_ENABLED and not VECTOR_INDEX_DIR:
+    print("⚠️ VECTOR_INDEX_ENABLED is set but VECTOR_INDEX_DIR is not, using the database index only")
+    VECTOR_INDEX_ENABLED = False
+
+# Projects with more chunks than this stay on the database index
+VECTOR_INDEX_MAX_CHUNKS = int(os.getenv("VECTOR_INDEX_MAX_CHUNKS", "20000"))
+
+# float32, or float16 to halve the file size at a small cost in precision
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+
+# An index not checked against the database for this long is stale until it is
+VECTOR_INDEX_MAX_AGE = float(os.getenv("VECTOR_INDEX_MAX_AGE", "600"))
+
+# Projects with the most recent chats whose indexes are loaded at API startup
+VECTOR_INDEX_WARM_PROJECTS = int(os.getenv("VECTOR_INDEX_WARM_PROJECTS", "20"))
+
+# Rebuild in place once this fraction of the rows has been deleted
+VECTOR_INDEX_COMPACT_RATIO = 0.25
+
+BUILD_PAGE_SIZE = 500
+SEARCH_BLOCK_ROWS = 8192
+
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+
+# Builds and freshness checks run off the request path, one at a time
+maintenance_executor = ThreadPoolExecutor(max_workers=1)
+scheduled = set()
+scheduled_lock = threading.Lock()
+
+loaded = {}
+loaded_lock = threading.Lock()
+
+
+class ProjectIndex:
+    """
+    Embeddings of one project's chunks as a memory-mapped (rows, dim) matrix
+    plus the matching chunk ids, searched by brute-force inner product.
+    """
+
+    def __init__(self, project_dir: str, meta: dict):
+        self.meta = meta
+        self.ids = np.array(meta["ids"], dtype=object)
+        rows = len(self.ids)
+        self.vectors = np.memmap(
+            os.path.join(project_dir, meta["vectors"]),
+            dtype=meta["dtype"],
+            mode="r",
+            shape=(rows, meta["dim"])
+        ) if rows else np.empty((0, meta["dim"]), dtype=meta["dtype"])
+        self.live = np.ones(rows, dtype=bool)
+        if meta["deleted"]:
+            self.live[np.isin(self.ids, meta["deleted"])] = False
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() - self.meta["verified_at"] < VECTOR_INDEX_MAX_AGE
+
+    def search(self, query_embedding: list, match_count: int, similarity_threshold: float) -> list:
+        """Top match_count (chunk_id, similarity) pairs above the threshold, best first"""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        rows = len(self.ids)
+        if not rows or query.shape[0] != self.meta["dim"]:
+            return []
+
+        scores = np.empty(rows, dtype=np.float32)
+        for start in range(0, rows, SEARCH_BLOCK_ROWS):
+            block = self.vectors[start:start + SEARCH_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32, copy=False) @ query
+        scores[~self.live] = -np.inf
+
+        k = min(max(match_count, 1), rows)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] >= similarity_threshold]
+
+
+def project_dir(project_id: str) -> str:
+    return os.path.join(VECTOR_INDEX_DIR, str(project_id))
+
+
+def lock_exclusive(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return
+    # LK_LOCK gives up after about 10 seconds of retrying; keep waiting like flock does
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+
+def unlock(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def project_lock(project_id: str):
+    """Serialises writers of a project's index across processes"""
+    path = project_dir(project_id)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LOCK_FILE), "w") as lock_file:
+        lock_exclusive(lock_file)
+        try:
+            yield path
+        finally:
+            unlock(lock_file)
+
+
+def read_meta(project_id: str) -> dict:
+    try:
+        with open(os.path.join(project_dir(project_id), META_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_meta(path: str, meta: dict):
+    """Replace the metadata atomically so readers never see a half written file"""
+    tmp_path = os.path.join(path, f"{META_FILE}.{uuid.uuid4().hex}")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, META_FILE))
+
+
+def write_vectors(path: str, ids: list, vectors: np.ndarray, dim: int, too_large: bool = False):
+    """Write a fresh vectors file and point the metadata at it; the old file goes afterwards"""
+    old_meta = None
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            old_meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+
+    # Each rewrite gets a new file name, so processes still mapping the old one are unaffected
+    vectors_file = f"vectors-{uuid.uuid4().hex}.bin"
+    with open(os.path.join(path, vectors_file), "wb") as f:
+        f.write(np.ascontiguousarray(vectors, dtype=VECTOR_INDEX_DTYPE).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+    write_meta(path, {
+        "dim": dim,
+        "dtype": VECTOR_INDEX_DTYPE,
+        "vectors": vectors_file,
+        "ids": ids,
+        "deleted": [],
+        "too_large": too_large,
+        "verified_at": time.time(),
+    })
+    if old_meta and old_meta.get("vectors") != vectors_file:
+        try:
+            os.remove(os.path.join(path, old_meta["vectors"]))
+        except FileNotFoundError:
+            pass
+
+
+def count_project_chunks(project_id: str) -> int:
+    result = supabase.table("document_chunks").select(
+        "id, project_documents!inner(project_id)", count="exact", head=True
+    ).eq("project_documents.project_id", project_id).execute()
+    return result.count or 0
+
+
+def parse_embedding(value) -> list:
+    # pgvector columns come back from PostgREST as their text form "[0.1,0.2,...]"
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def build_index(project_id: str):
+    """Build a project's index from document_chunks, replacing whatever was there"""
+    started = time.perf_counter()
+    chunk_count = count_project_chunks(project_id)
+
+    with project_lock(project_id) as path:
+        if chunk_count > VECTOR_INDEX_MAX_CHUNKS:
+            # Remember the decision so the project isn't recounted on every query
+            write_vectors(path, [], np.empty((0, 0)), 0, too_large=True)
+            print(f"🗂️ Project {project_id} has {chunk_count} chunks, staying on the database index")
+            return
+
+        # Filled one page at a time into a preallocated float32 matrix, so only a
+        # page of parsed embeddings ever exists as Python floats
+        ids = []
+        matrix = None
+        dim = 0
+        start = 0
+        while True:
+            result = supabase.table("document_chunks").select(
+                "id, embedding, project_documents!inner(project_id)"
+            ).eq("project_documents.project_id", project_id).order("id").range(
+                start, start + BUILD_PAGE_SIZE - 1
+            ).execute()
+            for row in result.data or []:
+                if not row.get("embedding"):
+                    continue
+                vector = parse_embedding(row["embedding"])
+                if matrix is None:
+                    dim = len(vector)
+                    matrix = np.empty((max(chunk_count, 1), dim), dtype=np.float32)
+                elif len(ids) == len(matrix):
+                    # Chunks added since the count
+                    matrix = np.concatenate([matrix, np.empty((BUILD_PAGE_SIZE, dim), dtype=np.float32)])
+                matrix[len(ids)] = vector
+                ids.append(row["id"])
+            if len(result.data or []) < BUILD_PAGE_SIZE:
+                break
+            start += BUILD_PAGE_SIZE
+
+        matrix = matrix[:len(ids)] if matrix is not None else np.empty((0, 0), dtype=np.float32)
+        write_vectors(path, ids, matrix, dim)
+
+    print(f"🗂️ Built vector index for project {project_id}: {len(ids)} chunks in {time.perf_counter() - started:.2f}s")
+
+
+def verify_index(project_id: str):
+    """Cheap freshness check: rebuild if the chunk count drifted, otherwise mark as verified"""
+    meta = read_meta(project_id)
+    if meta is None:
+        return build_index(project_id)
+
+    live_rows = len(meta["ids"]) - len(meta["deleted"])
+    chunk_count = count_project_chunks(project_id)
+    if meta.get("too_large") and chunk_count > VECTOR_INDEX_MAX_CHUNKS:
+        live_rows = chunk_count
+    if live_rows != chunk_count:
+        print(f"⚠️ Vector index for project {project_id} is out of date ({live_rows} vs {chunk_count} chunks), rebuilding")
+        return build_index(project_id)
+
+    with project_lock(project_id) as path:
+        current = read_meta(project_id)
+        if current and current["vectors"] == meta["vectors"]:
+            current["verified_at"] = time.time()
+            write_meta(path, current)
+
+
+def schedule(task, project_id: str):
+    """Queue a build/verification for a project unless one is already pending"""
+    key = (task.__name__, project_id)
+    with scheduled_lock:
+        if key in scheduled:
+            return
+        scheduled.add(key)
+
+    def run():
+        try:
+            task(project_id)
+        except Exception as e:
+            print(f"⚠️ Vector index {task.__name__} failed for project {project_id}: {e}")
+        finally:
+            with scheduled_lock:
+                scheduled.discard(key)
+
+    maintenance_executor.submit(run)
+
+
+def get_index(project_id: str) -> ProjectIndex:
+    """
+    The project's loaded index, or None when the caller should use the database.
+
+    A missing index is built and a stale one re-verified in the background;
+    the metadata file's mtime tells when another process (a worker) changed it.
+    """
+    try:
+        mtime = os.stat(os.path.join(project_dir(project_id), META_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        schedule(build_index, project_id)
+        return None
+
+    with loaded_lock:
+        entry = loaded.get(project_id)
+    if entry is None or entry[0] != mtime:
+        meta = read_meta(project_id)
+        if meta is None:
+            return None
+        index = ProjectIndex(project_dir(project_id), meta)
+        with loaded_lock:
+            loaded[project_id] = (mtime, index)
+    else:
+        index = entry[1]
+
+    if not index.fresh:
+        schedule(verify_index, project_id)
+        return None
+    if index.meta.get("too_large"):
+        return None
+    return index
+
+
+def search_index(project_id: str, query_embedding: list, settings: dict) -> list:
+    """
+    Vector search against the local index, hydrated from document_chunks.
+    Returns None when the project has no usable index.
+    """
+    index = get_index(project_id)
+    if index is None:
+        return None
+
+    matches = index.search(query_embedding, int(settings["chunks_per_search"]), float(settings["similarity_threshold"]))
+    if not matches:
+        return []
+
+    result = supabase.table("document_chunks").select(
+        "id, document_id, content, original_content, page_number, chunk_index, project_documents(filename)"
+    ).in_("id", [chunk_id for chunk_id, _ in matches]).execute()
+    rows = {row["id"]: row for row in result.data or []}
+
+    chunks = []
+    for chunk_id, similarity in matches:
+        row = rows.get(chunk_id)
+        if row is None:
+            # Deleted since the index was last updated
+            continue
+        document = row.pop("project_documents", None) or {}
+        if isinstance(row.get("original_content"), dict):
+            # Same shape as match_document_chunks: image payloads never leave the database
+            row["original_content"].pop("images", None)
+        chunks.append({
+            **row,
+            "filename": document.get("filename"),
+            "similarity": similarity,
+            "score": similarity,
+        })
+    return chunks
+
+
+def apply_chunk_changes(project_id: str, added: list, removed_ids: list = None):
+    """
+    Incrementally update an existing index after ingestion: append the
+    (chunk_id, embedding) pairs in `added` and tombstone `removed_ids`.
+    Projects without an index are left alone; it is built on first use.
+    """
+    if not VECTOR_INDEX_ENABLED or read_meta(project_id) is None:
+        return
+
+    rebuild = False
+    with project_lock(project_id) as path:
+        meta = read_meta(project_id)
+        if meta is None or meta.get("too_large"):
+            return
+
+        vectors = np.asarray([embedding for _, embedding in added], dtype=np.float32)
+        known_ids = set(meta["ids"])
+        deleted = set(meta["deleted"]) | {chunk_id for chunk_id in removed_ids or [] if chunk_id in known_ids}
+        rows = len(meta["ids"]) + len(added)
+
+        if (added and vectors.shape[1] != meta["dim"]) or len(deleted) > VECTOR_INDEX_COMPACT_RATIO * rows or rows > VECTOR_INDEX_MAX_CHUNKS:
+            # Empty index, changed embedding model, too many tombstones or grown too large:
+            # the database already holds the new chunks, so rebuild from it
+            rebuild = True
+        else:
+            if added:
+                # Append in place; readers only map the rows listed in the metadata
+                with open(os.path.join(path, meta["vectors"]), "ab") as f:
+                    f.write(np.ascontiguousarray(vectors, dtype=meta["dtype"]).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            meta["ids"] = meta["ids"] + [chunk_id for chunk_id, _ in added]
+            meta["deleted"] = sorted(deleted)
+            write_meta(path, meta)
+
+    if rebuild:
+        build_index(project_id)
+
+
+def drop_index(project_id: str):
+    if not VECTOR_INDEX_ENABLED:
+        return
+    shutil.rmtree(project_dir(project_id), ignore_errors=True)
+    with loaded_lock:
+        loaded.pop(project_id, None)
+
+
+def invalidate_index(project_id: str):
+    """Stop using the index until it has been re-verified against the database"""
+    if VECTOR_INDEX_ENABLED and read_meta(project_id) is not None:
+        with project_lock(project_id) as path:
+            meta = read_meta(project_id)
+            if meta:
+                meta["verified_at"] = 0
+                write_meta(path, meta)
+
+
+def warm_indexes():
+    """Load (or build) the indexes of the projects with the most recent chats. Blocking"""
+    if not VECTOR_INDEX_ENABLED or VECTOR_INDEX_WARM_PROJECTS <= 0:
+        return
+
+    result = supabase.table("chats").select("project_id").order("created_at", desc=True).limit(
+        VECTOR_INDEX_WARM_PROJECTS * 10
+    ).execute()
+    hot_projects = list(dict.fromkeys(row["project_id"] for row in result.data or []))[:VECTOR_INDEX_WARM_PROJECTS]
+
+    for project_id in hot_projects:
+        get_index(project_id)
+    print(f"🔥 Warming vector indexes for {len(hot_projects)} projects")
@@ -0,0 +1,26 @@
+from contextlib import contextmanager
+from dotenv import load_dotenv
+import os
+import shutil
+import tempfile
+
+
+load_dotenv()
+
+# Parent directory for per-task workspaces (defaults to the system temp dir)
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT") or tempfile.gettempdir()
+
+
+@contextmanager
+def task_workspace(name: str):
+    """
+    Yield a fresh, uniquely named directory for one task's scratch files and
+    remove it (with everything in it) when the task is done, even on failure.
+    """
+    os.makedirs(WORKSPACE_ROOT, exist_ok=True)
+    workspace = tempfile.mkdtemp(prefix=f"{name}-", dir=WORKSPACE_ROOT)
+    try:
+        yield workspace
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+        print(f"Cleaned up workspace: {workspace}")
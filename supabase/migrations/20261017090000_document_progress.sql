@@ -0,0 +1,21 @@
+-- 002_document_progress.sql
+-- Merge progress updates into project_documents.processing_details server-side
+
+-- Merges p_details into processing_details in a single UPDATE, so progress writers
+-- never need to read the current details first and concurrent writers don't
+-- overwrite each other's keys. A NULL p_status leaves the status unchanged.
+CREATE OR REPLACE FUNCTION update_document_progress(
+    p_document_id UUID,
+    p_status TEXT,
+    p_details JSONB DEFAULT '{}'
+)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    UPDATE project_documents
+    SET processing_status = COALESCE(p_status, processing_status),
+        processing_details = (
+            COALESCE(processing_details::jsonb, '{}'::jsonb) || COALESCE(p_details, '{}'::jsonb)
+        )::json
+    WHERE id = p_document_id;
+$$;
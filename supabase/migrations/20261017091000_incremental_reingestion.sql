@@ -0,0 +1,23 @@
+-- 003_incremental_reingestion.sql
+-- Source fingerprints and chunk content hashes for incremental reprocessing
+
+-- S3 ETag (files) or SHA-256 of the crawled page (URLs) at the last successful ingest
+ALTER TABLE project_documents ADD COLUMN source_fingerprint TEXT;
+
+-- SHA-256 of the chunk's source content (text, tables, images) before summarisation
+ALTER TABLE document_chunks ADD COLUMN content_hash TEXT;
+
+CREATE INDEX document_chunks_document_hash_idx ON document_chunks (document_id, content_hash);
+
+-- Move retained chunks to their new positions in one round trip.
+-- p_positions: [{"id": "...", "chunk_index": 0, "page_number": 1}, ...]
+CREATE OR REPLACE FUNCTION update_chunk_positions(p_positions JSONB)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    UPDATE document_chunks dc
+    SET chunk_index = (p->>'chunk_index')::INTEGER,
+        page_number = (p->>'page_number')::INTEGER
+    FROM jsonb_array_elements(p_positions) AS p
+    WHERE dc.id = (p->>'id')::UUID;
+$$;
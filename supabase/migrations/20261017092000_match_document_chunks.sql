@@ -0,0 +1,41 @@
+-- 004_match_document_chunks.sql
+-- Server-side top-k vector search over a project's chunks
+
+-- Embeddings are unit length, so the negative inner product (<#>, which the HNSW
+-- index is built for) orders results exactly like cosine similarity.
+-- Image payloads are stripped from original_content: prompts never use them.
+CREATE OR REPLACE FUNCTION match_document_chunks(
+    query_embedding vector(1536),
+    p_project_id UUID,
+    match_count INTEGER DEFAULT 10,
+    similarity_threshold FLOAT DEFAULT 0
+)
+RETURNS TABLE (
+    id UUID,
+    document_id UUID,
+    filename TEXT,
+    content TEXT,
+    original_content JSON,
+    page_number INTEGER,
+    chunk_index INTEGER,
+    similarity FLOAT
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        dc.id,
+        dc.document_id,
+        pd.filename,
+        dc.content,
+        (COALESCE(dc.original_content::jsonb, '{}'::jsonb) - 'images')::json,
+        dc.page_number,
+        dc.chunk_index,
+        -(dc.embedding <#> query_embedding) AS similarity
+    FROM document_chunks dc
+    JOIN project_documents pd ON pd.id = dc.document_id
+    WHERE pd.project_id = p_project_id
+      AND -(dc.embedding <#> query_embedding) >= similarity_threshold
+    ORDER BY dc.embedding <#> query_embedding
+    LIMIT match_count;
+$$;
@@ -0,0 +1,80 @@
+-- 006_answer_cache.sql
+-- Project-scoped semantic cache of chat answers
+
+CREATE TABLE answer_cache (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    settings_hash TEXT NOT NULL,
+    question TEXT NOT NULL,
+    question_embedding vector(1536) NOT NULL,
+    answer TEXT NOT NULL,
+    citations JSON DEFAULT '[]',
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE INDEX answer_cache_project_idx ON answer_cache (project_id, settings_hash);
+
+-- Closest cached question of the project (same settings) above the threshold
+CREATE OR REPLACE FUNCTION match_answer_cache(
+    query_embedding vector(1536),
+    p_project_id UUID,
+    p_settings_hash TEXT,
+    similarity_threshold FLOAT DEFAULT 0.95
+)
+RETURNS TABLE (
+    id UUID,
+    question TEXT,
+    answer TEXT,
+    citations JSON,
+    similarity FLOAT
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        ac.id,
+        ac.question,
+        ac.answer,
+        ac.citations,
+        -(ac.question_embedding <#> query_embedding) AS similarity
+    FROM answer_cache ac
+    WHERE ac.project_id = p_project_id
+      AND ac.settings_hash = p_settings_hash
+      AND -(ac.question_embedding <#> query_embedding) >= similarity_threshold
+    ORDER BY ac.question_embedding <#> query_embedding
+    LIMIT 1;
+$$;
+
+-- Any change to what a project's answers are based on drops its cached answers
+CREATE OR REPLACE FUNCTION invalidate_answer_cache()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM answer_cache WHERE project_id = OLD.project_id;
+    ELSE
+        DELETE FROM answer_cache WHERE project_id = NEW.project_id;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Documents added or deleted
+CREATE TRIGGER project_documents_answer_cache_changed
+    AFTER INSERT OR DELETE ON project_documents
+    FOR EACH ROW EXECUTE FUNCTION invalidate_answer_cache();
+
+-- Documents finishing (re)processing
+CREATE TRIGGER project_documents_answer_cache_completed
+    AFTER UPDATE OF processing_status ON project_documents
+    FOR EACH ROW
+    WHEN (NEW.processing_status = 'completed' AND OLD.processing_status IS DISTINCT FROM 'completed')
+    EXECUTE FUNCTION invalidate_answer_cache();
+
+-- Retrieval settings changed
+CREATE TRIGGER project_settings_answer_cache_changed
+    AFTER UPDATE ON project_settings
+    FOR EACH ROW
+    WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION invalidate_answer_cache();
@@ -0,0 +1,32 @@
+-- 007_chat_memory.sql
+-- Rolling summary of older turns on the chat row, so prompts only carry a bounded window
+
+ALTER TABLE chats
+    ADD COLUMN IF NOT EXISTS history_summary TEXT,
+    ADD COLUMN IF NOT EXISTS summarized_until TIMESTAMPTZ;
+
+-- Newest-first window reads per chat
+CREATE INDEX IF NOT EXISTS messages_chat_id_created_at_idx ON messages (chat_id, created_at DESC);
+
+-- Stores a new summary only if nobody else has folded messages in since it was read
+-- (summarized_until unchanged), so concurrent summarisations can't move it backwards.
+-- Returns whether the summary was stored.
+CREATE OR REPLACE FUNCTION update_chat_summary(
+    p_chat_id UUID,
+    p_summary TEXT,
+    p_summarized_until TIMESTAMPTZ,
+    p_previous_until TIMESTAMPTZ
+)
+RETURNS BOOLEAN
+LANGUAGE sql
+AS $$
+    WITH updated AS (
+        UPDATE chats
+        SET history_summary = p_summary,
+            summarized_until = p_summarized_until
+        WHERE id = p_chat_id
+          AND summarized_until IS NOT DISTINCT FROM p_previous_until
+        RETURNING 1
+    )
+    SELECT EXISTS (SELECT 1 FROM updated);
+$$;
@@ -0,0 +1,51 @@
+-- 008_list_pagination.sql
+-- updated_at tracking and keyset indexes for the paginated list endpoints
+
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$;
+
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT now();
+ALTER TABLE project_documents ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT now();
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT now();
+
+-- Existing rows start out "changed" when they were created
+UPDATE projects SET updated_at = created_at WHERE updated_at IS DISTINCT FROM created_at;
+UPDATE project_documents SET updated_at = created_at WHERE updated_at IS DISTINCT FROM created_at;
+UPDATE chats SET updated_at = created_at WHERE updated_at IS DISTINCT FROM created_at;
+
+-- Every update (including progress writes from update_document_progress) bumps updated_at
+DROP TRIGGER IF EXISTS projects_set_updated_at ON projects;
+CREATE TRIGGER projects_set_updated_at
+    BEFORE UPDATE ON projects
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS project_documents_set_updated_at ON project_documents;
+CREATE TRIGGER project_documents_set_updated_at
+    BEFORE UPDATE ON project_documents
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS chats_set_updated_at ON chats;
+CREATE TRIGGER chats_set_updated_at
+    BEFORE UPDATE ON chats
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+-- Keyset pages: newest first by (created_at, id) within the parent
+CREATE INDEX IF NOT EXISTS projects_clerk_id_created_at_id_idx ON projects (clerk_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS project_documents_project_id_created_at_id_idx ON project_documents (project_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS chats_project_id_created_at_id_idx ON chats (project_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS messages_chat_id_created_at_id_idx ON messages (chat_id, created_at DESC, id DESC);
+
+-- Change polling: oldest change first by (updated_at, id) within the parent
+CREATE INDEX IF NOT EXISTS projects_clerk_id_updated_at_id_idx ON projects (clerk_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS project_documents_project_id_updated_at_id_idx ON project_documents (project_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS chats_project_id_updated_at_id_idx ON chats (project_id, updated_at, id);
+
+-- Superseded by messages_chat_id_created_at_id_idx
+DROP INDEX IF EXISTS messages_chat_id_created_at_idx;
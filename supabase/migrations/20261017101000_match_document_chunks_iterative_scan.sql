@@ -0,0 +1,51 @@
+-- 009_match_document_chunks_iterative_scan.sql
+-- Keep project-scoped vector search from coming back short on the shared HNSW index
+
+-- The HNSW index spans every project's chunks, and the project / threshold filter
+-- is applied to what the index scan returns. With a plain scan only ef_search
+-- (default 40) candidates are visited, so once other tenants' chunks fill the
+-- nearest neighbours a small project gets few or no matches.
+-- hnsw.iterative_scan (pgvector >= 0.8) keeps scanning until match_count rows
+-- pass the filter (bounded by hnsw.max_scan_tuples); relaxed_order can return
+-- them slightly out of order, so the materialised candidates are sorted again.
+CREATE OR REPLACE FUNCTION match_document_chunks(
+    query_embedding vector(1536),
+    p_project_id UUID,
+    match_count INTEGER DEFAULT 10,
+    similarity_threshold FLOAT DEFAULT 0
+)
+RETURNS TABLE (
+    id UUID,
+    document_id UUID,
+    filename TEXT,
+    content TEXT,
+    original_content JSON,
+    page_number INTEGER,
+    chunk_index INTEGER,
+    similarity FLOAT
+)
+LANGUAGE sql
+STABLE
+SET hnsw.iterative_scan = relaxed_order
+SET hnsw.ef_search = 100
+AS $$
+    WITH candidates AS MATERIALIZED (
+        SELECT
+            dc.id,
+            dc.document_id,
+            pd.filename,
+            dc.content,
+            (COALESCE(dc.original_content::jsonb, '{}'::jsonb) - 'images')::json AS original_content,
+            dc.page_number,
+            dc.chunk_index,
+            -(dc.embedding <#> query_embedding) AS similarity
+        FROM document_chunks dc
+        JOIN project_documents pd ON pd.id = dc.document_id
+        WHERE pd.project_id = p_project_id
+          AND -(dc.embedding <#> query_embedding) >= similarity_threshold
+        ORDER BY dc.embedding <#> query_embedding
+        LIMIT match_count
+    )
+    SELECT * FROM candidates
+    ORDER BY similarity DESC;
+$$;
@@ -0,0 +1,108 @@
+-- 010_hybrid_search_iterative_scan.sql
+-- Same fix as 009 for the vector half of hybrid search
+
+-- vector_hits filtered the shared HNSW index scan by project afterwards, so a
+-- small project could get few or no vector candidates. The iterative scan keeps
+-- going until match_count * candidate_multiplier rows pass the filter.
+CREATE OR REPLACE FUNCTION hybrid_search_document_chunks(
+    query_text TEXT,
+    query_embedding vector(1536),
+    p_project_id UUID,
+    match_count INTEGER DEFAULT 10,
+    similarity_threshold FLOAT DEFAULT 0,
+    vector_weight FLOAT DEFAULT 0.7,
+    keyword_weight FLOAT DEFAULT 0.3,
+    fusion TEXT DEFAULT 'rrf',
+    rrf_k INTEGER DEFAULT 60,
+    candidate_multiplier INTEGER DEFAULT 4
+)
+RETURNS TABLE (
+    id UUID,
+    document_id UUID,
+    filename TEXT,
+    content TEXT,
+    original_content JSON,
+    page_number INTEGER,
+    chunk_index INTEGER,
+    similarity FLOAT,
+    keyword_score FLOAT,
+    score FLOAT
+)
+LANGUAGE sql
+STABLE
+SET hnsw.iterative_scan = relaxed_order
+SET hnsw.ef_search = 100
+AS $$
+    WITH project_docs AS (
+        SELECT pd.id, pd.filename
+        FROM project_documents pd
+        WHERE pd.project_id = p_project_id
+    ),
+    vector_candidates AS MATERIALIZED (
+        SELECT
+            dc.id,
+            -(dc.embedding <#> query_embedding) AS score
+        FROM document_chunks dc
+        JOIN project_docs pd ON pd.id = dc.document_id
+        WHERE -(dc.embedding <#> query_embedding) >= similarity_threshold
+        ORDER BY dc.embedding <#> query_embedding
+        LIMIT match_count * candidate_multiplier
+    ),
+    vector_hits AS (
+        -- Ranked after the scan: relaxed_order may return candidates slightly out of order
+        SELECT
+            vc.id,
+            vc.score,
+            row_number() OVER (ORDER BY vc.score DESC) AS rank
+        FROM vector_candidates vc
+    ),
+    keyword_query AS (
+        SELECT websearch_to_tsquery('english', query_text) AS q
+    ),
+    keyword_ranked AS (
+        SELECT dc.id, ts_rank_cd(dc.fts, kq.q) AS score
+        FROM document_chunks dc
+        JOIN project_docs pd ON pd.id = dc.document_id
+        CROSS JOIN keyword_query kq
+        WHERE dc.fts @@ kq.q
+        ORDER BY score DESC
+        LIMIT match_count * candidate_multiplier
+    ),
+    keyword_hits AS (
+        SELECT
+            kr.id,
+            kr.score,
+            kr.score / NULLIF(max(kr.score) OVER (), 0) AS normalised_score,
+            row_number() OVER (ORDER BY kr.score DESC) AS rank
+        FROM keyword_ranked kr
+    ),
+    fused AS (
+        SELECT
+            COALESCE(v.id, k.id) AS id,
+            v.score AS similarity,
+            k.score AS keyword_score,
+            CASE WHEN fusion = 'weighted' THEN
+                vector_weight * COALESCE(v.score, 0) + keyword_weight * COALESCE(k.normalised_score, 0)
+            ELSE
+                vector_weight * COALESCE(1.0 / (rrf_k + v.rank), 0) + keyword_weight * COALESCE(1.0 / (rrf_k + k.rank), 0)
+            END AS score
+        FROM vector_hits v
+        FULL OUTER JOIN keyword_hits k ON k.id = v.id
+    )
+    SELECT
+        dc.id,
+        dc.document_id,
+        pd.filename,
+        dc.content,
+        (COALESCE(dc.original_content::jsonb, '{}'::jsonb) - 'images')::json,
+        dc.page_number,
+        dc.chunk_index,
+        f.similarity,
+        f.keyword_score,
+        f.score
+    FROM fused f
+    JOIN document_chunks dc ON dc.id = f.id
+    JOIN project_docs pd ON pd.id = dc.document_id
+    ORDER BY f.score DESC
+    LIMIT match_count;
+$$;
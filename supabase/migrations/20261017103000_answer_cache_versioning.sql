@@ -0,0 +1,139 @@
+-- 011_answer_cache_versioning.sql
+-- Expiry, a per-project cap and invalidation versions for the answer cache
+
+-- Bumped by every invalidation. An entry is only served while its project_version
+-- matches, so an answer computed before an invalidation but inserted after it is
+-- never used. No foreign key: deleting a project cascades to its documents, whose
+-- trigger bumps the version of the project being deleted.
+CREATE TABLE IF NOT EXISTS answer_cache_versions (
+    project_id UUID PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+ALTER TABLE answer_cache ADD COLUMN IF NOT EXISTS project_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS answer_cache_project_created_at_idx ON answer_cache (project_id, created_at DESC);
+
+CREATE OR REPLACE FUNCTION invalidate_answer_cache()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    target_project_id UUID := CASE WHEN TG_OP = 'DELETE' THEN OLD.project_id ELSE NEW.project_id END;
+BEGIN
+    INSERT INTO answer_cache_versions (project_id, version)
+    VALUES (target_project_id, 1)
+    ON CONFLICT (project_id) DO UPDATE SET version = answer_cache_versions.version + 1;
+
+    DELETE FROM answer_cache WHERE project_id = target_project_id;
+    RETURN NULL;
+END;
+$$;
+
+-- A reprocess that found the source unchanged completes without touching any
+-- chunk (processing_details.reprocess.skipped), so it leaves the cache alone
+DROP TRIGGER IF EXISTS project_documents_answer_cache_completed ON project_documents;
+CREATE TRIGGER project_documents_answer_cache_completed
+    AFTER UPDATE OF processing_status ON project_documents
+    FOR EACH ROW
+    WHEN (
+        NEW.processing_status = 'completed'
+        AND OLD.processing_status IS DISTINCT FROM 'completed'
+        AND (NEW.processing_details::jsonb #>> '{reprocess,skipped}') IS DISTINCT FROM 'true'
+    )
+    EXECUTE FUNCTION invalidate_answer_cache();
+
+-- Returns exactly one row: the project's current version, plus the closest live
+-- cached question (same settings, current version, not expired) when there is one
+DROP FUNCTION IF EXISTS match_answer_cache(vector, UUID, TEXT, FLOAT);
+CREATE OR REPLACE FUNCTION match_answer_cache(
+    query_embedding vector(1536),
+    p_project_id UUID,
+    p_settings_hash TEXT,
+    similarity_threshold FLOAT DEFAULT 0.95,
+    max_age_seconds INTEGER DEFAULT 604800
+)
+RETURNS TABLE (
+    id UUID,
+    question TEXT,
+    answer TEXT,
+    citations JSON,
+    similarity FLOAT,
+    project_version BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH current_version AS (
+        SELECT COALESCE(
+            (SELECT v.version FROM answer_cache_versions v WHERE v.project_id = p_project_id), 0
+        ) AS version
+    )
+    SELECT
+        hit.id,
+        hit.question,
+        hit.answer,
+        hit.citations,
+        hit.similarity,
+        cv.version
+    FROM current_version cv
+    LEFT JOIN LATERAL (
+        SELECT
+            ac.id,
+            ac.question,
+            ac.answer,
+            ac.citations,
+            -(ac.question_embedding <#> query_embedding) AS similarity
+        FROM answer_cache ac
+        WHERE ac.project_id = p_project_id
+          AND ac.settings_hash = p_settings_hash
+          AND ac.project_version = cv.version
+          AND ac.created_at > now() - make_interval(secs => max_age_seconds)
+          AND -(ac.question_embedding <#> query_embedding) >= similarity_threshold
+        ORDER BY ac.question_embedding <#> query_embedding
+        LIMIT 1
+    ) hit ON true;
+$$;
+
+-- Insert an answer computed at p_project_version (skipped when the project has been
+-- invalidated since), then drop the project's expired entries and all but the newest
+-- max_entries
+CREATE OR REPLACE FUNCTION store_answer_cache(
+    p_project_id UUID,
+    p_project_version BIGINT,
+    p_settings_hash TEXT,
+    p_question TEXT,
+    p_question_embedding vector(1536),
+    p_answer TEXT,
+    p_citations JSON,
+    max_entries INTEGER DEFAULT 500,
+    max_age_seconds INTEGER DEFAULT 604800
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF p_project_version IS DISTINCT FROM COALESCE(
+        (SELECT v.version FROM answer_cache_versions v WHERE v.project_id = p_project_id), 0
+    ) THEN
+        RETURN false;
+    END IF;
+
+    INSERT INTO answer_cache (project_id, project_version, settings_hash, question, question_embedding, answer, citations)
+    VALUES (p_project_id, p_project_version, p_settings_hash, p_question, p_question_embedding, p_answer, p_citations);
+
+    DELETE FROM answer_cache ac
+    WHERE ac.project_id = p_project_id
+      AND (
+        ac.created_at <= now() - make_interval(secs => max_age_seconds)
+        OR ac.id NOT IN (
+            SELECT newest.id
+            FROM answer_cache newest
+            WHERE newest.project_id = p_project_id
+            ORDER BY newest.created_at DESC
+            LIMIT max_entries
+        )
+      );
+    RETURN true;
+END;
+$$;
@@ -1,8 +1,21 @@
-from celery import Celery
+from celery import Celery, chain
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
+import io
+import json
 import os
+import time
+import uuid
 from database import supabase
 from services.s3_service import S3Service
-from unstructured.partition.pdf import partition_pdf
+from services.progress_service import ProgressReporter
+from services.workspace_service import task_workspace
+from services.pdf_service import partition_pdf_document, partition_pdf_hi_res
+from services.embedding_cache import build_embedding_cache
+from services.summary_cache import build_summary_cache
+from services.vector_index_service import apply_chunk_changes, invalidate_index
+from services.chat_memory_service import update_summary
+from services.asset_service import offload_original_content, needs_offload
 from unstructured.partition.docx import partition_docx
 from unstructured.partition.html import partition_html
 from unstructured.partition.ppt import partition_pptx
@@ -11,6 +24,7 @@ from unstructured.partition.md import partition_md
 from unstructured.chunking.title import chunk_by_title 
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_core.messages import HumanMessage
+from postgrest.types import ReturnMethod
 from dotenv import load_dotenv
 from scrapingbee import ScrapingBeeClient
 
@@ -33,177 +47,320 @@ embeddings_model = OpenAIEmbeddings(
     openai_api_key=os.getenv("OPENROUTER_API_KEY")
 )
 
+embedding_cache = build_embedding_cache(embeddings_model.model, embeddings_model.dimensions)
+
+# Max number of chunks summarised in parallel within one document
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "8"))
+
+# Rows per document_chunks insert request, and retries before a failing batch is split
+CHUNK_INSERT_BATCH_SIZE = int(os.getenv("CHUNK_INSERT_BATCH_SIZE", "100"))
+CHUNK_INSERT_RETRIES = int(os.getenv("CHUNK_INSERT_RETRIES", "2"))
+
+# Queues for the pipeline stages, so CPU-bound partitioning and IO-bound LLM /
+# embedding work can be served by differently sized worker pools
+PARTITION_QUEUE = os.getenv("PARTITION_QUEUE", "partition")
+SUMMARISE_QUEUE = os.getenv("SUMMARISE_QUEUE", "summarise")
+EMBED_QUEUE = os.getenv("EMBED_QUEUE", "embed")
+
 celery_app = Celery(
     "document_processos",
     broker=os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0"),
     backend=os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
 )
 
-def update_status(document_id: str,status:str, details: dict = None ):
+celery_app.conf.update(
+    task_serializer="json",
+    result_serializer="json",
+    accept_content=["json"],
+    task_routes={
+        "tasks.partition_stage": {"queue": PARTITION_QUEUE},
+        "tasks.summarise_stage": {"queue": SUMMARISE_QUEUE},
+        "tasks.store_stage": {"queue": EMBED_QUEUE},
+    },
+    # Stages are long-running; don't let one worker hoard queued documents
+    worker_prefetch_multiplier=1,
+)
+
+def queue_document_processing(document_id, reprocess: bool = False):
     """
-        Update document status dynamically
+        Document processing: chains the pipeline stages, each routed to its own queue.
+        With reprocess=True an unchanged source is skipped entirely.
+        Returns the pipeline's AsyncResult; its id (the final stage's task id) is
+        what project_documents.task_id tracks.
     """
-    result = supabase.table("project_documents").select("processing_details").eq("id",document_id).execute()
-    
-    current_details = {}
-    if result and result.data[0]['processing_details']:
-        current_details = result.data[0]['processing_details']
-        
-    if details:
-        current_details.update(details)
-        
-    result = supabase.table("project_documents").update({
-            "processing_status": status,
-            "processing_details": current_details
-            }).eq("id", document_id).execute()
-    
+    result = chain(
+        partition_stage.s(document_id, reprocess),
+        summarise_stage.s(),
+        store_stage.s()
+    ).apply_async()
+    print(f"📨 Queued processing pipeline for document: {document_id}")
+    return result
 
 @celery_app.task
-def processing_document(document_id):
+def processing_document(document_id, reprocess: bool = False):
+    """Queue the processing pipeline from a worker (see queue_document_processing)"""
+    result = queue_document_processing(document_id, reprocess)
+    
+    return {
+        "status": "queued",
+        "document_id": document_id,
+        "pipeline_id": result.id
+    }
+
+# The first two stages hand chunks (with images and table HTML) to the next stage
+# through the chain itself; storing those payloads in the result backend as well
+# would keep a copy of every document in Redis until the results expire
+@celery_app.task(ignore_result=True)
+def partition_stage(document_id, reprocess: bool = False):
     """
-        Document processing
+        Stage 1 (CPU): download, partition and chunk the document.
+        Returns compact JSON chunks instead of unstructured elements, each matched
+        against the chunks already stored for the document.
     """
+    progress = ProgressReporter(document_id)
     try:
         doc_result = supabase.table("project_documents").select("*").eq("id",document_id).execute()
         document = doc_result.data[0]
         source_type = document.get('source_type','file')
         
+        # The fingerprint is only set by a fully completed ingest, so a match means
+        # the stored chunks already reflect this exact source
+        known_fingerprint = document.get('source_fingerprint') if reprocess else None
+        
         # 1. Download and partition
         print("Updating the status to processing")
-        update_status(document_id,"partitioning")
-        elemetns = download_and_partotion(
+        progress.update("partitioning")
+        elemetns, fingerprint = download_and_partotion(
             document_id=document_id,
-            document=document
+            document=document,
+            progress=progress,
+            known_fingerprint=known_fingerprint
         )
         
+        if known_fingerprint and fingerprint == known_fingerprint:
+            print(f"⏭️ Source unchanged, skipping reprocessing of document: {document_id}")
+            progress.close('completed', {"reprocess": {"skipped": True}})
+            return {
+                "document_id": document_id,
+                "skipped": True
+            }
+        
+        # The stored chunks are about to change; until this run completes they
+        # no longer match any fingerprint
+        if document.get('source_fingerprint'):
+            supabase.table("project_documents").update({
+                "source_fingerprint": None
+            }).eq("id", document_id).execute()
+        
         # 2. Chunk the element
         chunks,chunking_metrics = chunk_elements_title(elemetns)
-        update_status(document_id,"Summarizing",{
-            "chunking": chunking_metrics
+        
+        # 3. Diff against the stored chunks so only changed ones get summarised and embedded
+        compacted = compact_chunks(chunks, source_type)
+        removed_chunk_ids = match_existing_chunks(document_id, compacted)
+        reused = sum(1 for chunk in compacted if chunk.get('existing_id'))
+        
+        progress.update("Summarizing",{
+            "chunking": chunking_metrics,
+            "reprocess": {
+                "skipped": False,
+                "reused_chunks": reused,
+                "new_chunks": len(compacted) - reused,
+                "removed_chunks": len(removed_chunk_ids)
+            }
         })
-        # 3. summarize the chunks
-        processed_chunks = summarise_chunks(chunks,document_id,source_type)
+        progress.flush()
         
-        # 4. Vectorization and storing
-        update_status(document_id, 'vectorization')
-        stored_chunk_ids = store_chunks_with_embeddings(document_id, processed_chunks)
+        return {
+            "document_id": document_id,
+            "project_id": document["project_id"],
+            "fingerprint": fingerprint,
+            "chunks": compacted,
+            "removed_chunk_ids": removed_chunk_ids
+        }
+    except Exception as e:
+        print(str(e))
+        progress.close('failed', {"error": str(e)})
+        raise
 
-        # Mark as completed
-        update_status(document_id, 'completed')
-        print(f"✅ Celery task completed for document: {document_id} with {len(stored_chunk_ids)} chunks")
+@celery_app.task(ignore_result=True)
+def summarise_stage(payload):
+    """
+        Stage 2 (IO): summarize the chunks
+    """
+    document_id = payload["document_id"]
+    if payload.get("skipped"):
+        return payload
     
+    progress = ProgressReporter(document_id)
+    try:
+        chunks = payload["chunks"]
+        
+        # Retained chunks keep their stored summary; only new content is summarised
+        changed = [chunk for chunk in chunks if not chunk.get('existing_id')]
+        summarised = iter(summarise_chunks(changed,document_id,progress))
+        processed_chunks = [
+            {'existing_id': chunk['existing_id'], 'page_number': chunk['page_number']}
+            if chunk.get('existing_id') else next(summarised)
+            for chunk in chunks
+        ]
+        progress.flush()
+        
+        return {
+            **payload,
+            "chunks": processed_chunks
+        }
+    except Exception as e:
+        print(str(e))
+        progress.close('failed', {"error": str(e)})
+        raise
 
+@celery_app.task
+def store_stage(payload):
+    """
+        Stage 3 (IO): vectorization and storing
+    """
+    document_id = payload["document_id"]
+    if payload.get("skipped"):
         return {
-            "status": "success", 
+            "status": "skipped", 
             "document_id": document_id
         }
-
+    
+    progress = ProgressReporter(document_id)
+    try:
+        progress.update('vectorization')
+        stored_chunk_ids = store_chunks_with_embeddings(
+            document_id,
+            payload["chunks"],
+            progress,
+            removed_chunk_ids=payload.get("removed_chunk_ids"),
+            project_id=payload.get("project_id")
+        )
         
+        # Remember what was ingested so an unchanged reprocess can be skipped
+        if payload.get("fingerprint"):
+            supabase.table("project_documents").update({
+                "source_fingerprint": payload["fingerprint"]
+            }).eq("id", document_id).execute()
+
+        # Mark as completed
+        progress.close('completed')
+        print(f"✅ Celery task completed for document: {document_id} with {len(stored_chunk_ids)} chunks")
         
+        return {
+            "status": "success", 
+            "document_id": document_id
+        }
     except Exception as e:
         print(str(e))
+        progress.close('failed', {"error": str(e)})
+        # Some chunks may have been written already; don't trust the local index until it is re-verified
+        if payload.get("project_id"):
+            invalidate_index(payload["project_id"])
+        raise
     
-def download_and_partotion(document_id: str,document: dict):
+def download_and_partotion(document_id: str,document: dict,progress: ProgressReporter = None,known_fingerprint: str = None):
     """
-        Download document from S3 / Crwal the URL and partition the elements
+        Download document from S3 / Crwal the URL and partition the elements.
+        Returns (elements, source fingerprint); elements is None when the
+        fingerprint matches `known_fingerprint` and partitioning was skipped.
     """
+    progress = progress or ProgressReporter(document_id)
+    source = None
     try:
         source_type = document.get("source_type","file")
         
         print("Download and partition")
-        if source_type == "url":
-            # crwal the URL
-            url = document["source_url"]
-            
-            response = scrapingbee_client.get(url)
-            
-            temp_file = f"/tmp/{document_id}.html"
-            with open(temp_file,'wb') as f:
-                f.write(response.content)
-            
-            elements = partition_document(temp_file,"html",source_type="url")            
-        else:
-            s3_key = document.get("s3_key")
-            file_name = document.get('filename')
-            file_type = file_name.split('.')[-1].lower()
-            
-            s3_client = S3Service()
-            temp_file = s3_client.download_file_to_temp(
-                document_id=document_id,
-                file_key=s3_key,
-                file_type=file_type
-            )
-            
-            elements = partition_document(temp_file,file_type,source_type='file')
+        # Unique scratch directory per task, removed when partitioning is done
+        with task_workspace(document_id) as workspace:
+            if source_type == "url":
+                # crwal the URL; the page is partitioned straight from memory
+                url = document["source_url"]
+                
+                response = scrapingbee_client.get(url)
+                fingerprint = hashlib.sha256(response.content).hexdigest()
+                if known_fingerprint and fingerprint == known_fingerprint:
+                    return None, fingerprint
+                source = io.BytesIO(response.content)
+                
+                elements = partition_document(source,"html",source_type="url")            
+            else:
+                s3_key = document.get("s3_key")
+                file_name = document.get('filename')
+                file_type = file_name.split('.')[-1].lower()
+                
+                s3_client = S3Service()
+                fingerprint = s3_client.get_object_fingerprint(s3_key)
+                if known_fingerprint and fingerprint == known_fingerprint:
+                    return None, fingerprint
+                
+                # Small files come back as an in-memory buffer, large ones as a path
+                source = s3_client.download_document(
+                    file_key=s3_key,
+                    file_name=file_name,
+                    workspace=workspace
+                )
+                
+                elements = partition_document(source,file_type,source_type='file',workspace=workspace)
         
         element_summary = analyze_elements(elements)
-        update_status(document_id,"chunking",{
+        progress.update("chunking",{
             "partitioning":{
                 "elements_found": element_summary
             }
         })
             
-        return elements
+        return elements, fingerprint
     except Exception as e:
-        print(str(e))
+        # Propagates to partition_stage, which records it as the failure reason
+        print(f"❌ Download / partitioning failed for document {document_id}: {e}")
+        raise
     finally:
         # Always runs, even if exception occurs
-        if temp_file and os.path.exists(temp_file):
-            os.remove(temp_file)
-            print(f"Cleaned up temp file: {temp_file}")
+        if source is not None and not isinstance(source, str):
+            source.close()
 
-def partition_document(temp_file: str,file_type: str,source_type: str ='file'):
-    '''partistioning the documents'''
+def partition_document(source,file_type: str,source_type: str ='file',workspace: str = None):
+    '''partistioning the documents; `source` is a file path or a file-like object'''
     
-    try:
-        
-        if source_type == "url":
-            return partition_html(
-                filename=temp_file
+    source_args = {"filename": source} if isinstance(source, str) else {"file": source}
+    
+    if source_type == "url":
+        return partition_html(
+            **source_args
+        )
+    elif file_type=='pdf':
+        # Per-page strategy routing and page-range parallelism need a workspace for sub-PDFs
+        if workspace:
+            return partition_pdf_document(source, workspace)
+        return partition_pdf_hi_res(source)
+    
+    elif file_type=='docx':
+       return partition_docx(
+                **source_args,  # Path to your PDF file
+                strategy="hi_res", # Use the most accurate (but slower) processing method of extraction
+                infer_table_structure=True, # Keep tables as structured HTML, not jumbled text
             )
-        elif file_type=='pdf':
-           return partition_pdf(
-                    filename=temp_file,  # Path to your PDF file
-                    strategy="hi_res", # Use the most accurate (but slower) processing method of extraction
-                    infer_table_structure=True, # Keep tables as structured HTML, not jumbled text
-                    extract_image_block_types=["Image"], # Grab images found in the PDF
-                    extract_image_block_to_payload=True # Store images as base64 data you can actually use
-                )
-        
-        elif file_type=='pdf':
-           return partition_pdf(
-                    filename=temp_file,  # Path to your PDF file
-                    strategy="hi_res", # Use the most accurate (but slower) processing method of extraction
-                    infer_table_structure=True, # Keep tables as structured HTML, not jumbled text
-                    extract_image_block_types=["Image"], # Grab images found in the PDF
-                    extract_image_block_to_payload=True # Store images as base64 data you can actually use
-                )
-        
-        elif file_type=='docx':
-           return partition_docx(
-                    filename=temp_file,  # Path to your PDF file
-                    strategy="hi_res", # Use the most accurate (but slower) processing method of extraction
-                    infer_table_structure=True, # Keep tables as structured HTML, not jumbled text
-                )
-        
-        elif file_type=='pptx':
-           return partition_pptx(
-                    filename=temp_file,  # Path to your PDF file
-                    strategy="hi_res", # Use the most accurate (but slower) processing method of extraction
-                    infer_table_structure=True, # Keep tables as structured HTML, not jumbled text
-                )
-        
-        elif file_type=='txt':
-           return partition_text(
-                    filename=temp_file,  # Path to your PDF file
-                )
-        
-        elif file_type=='md':
-           return partition_md(
-                    filename=temp_file,  # Path to your PDF file
-           )
-    except Exception as e:
-        print(str(e))   
+    
+    elif file_type=='pptx':
+       return partition_pptx(
+                **source_args,  # Path to your PDF file
+                strategy="hi_res", # Use the most accurate (but slower) processing method of extraction
+                infer_table_structure=True, # Keep tables as structured HTML, not jumbled text
+            )
+    
+    elif file_type=='txt':
+       return partition_text(
+                **source_args,  # Path to your PDF file
+            )
+    
+    elif file_type=='md':
+       return partition_md(
+                **source_args,  # Path to your PDF file
+       )
+    
+    raise ValueError(f"Unsupported file type: {file_type}")
     
 def analyze_elements(elements):
     text_count = 0
@@ -259,74 +416,140 @@ def chunk_elements_title(elements):
     except Exception as e:
         raise Exception(f"Chunking failed : {str(e)}")
     
-def summarise_chunks(chunks,document_id,source_type="file"):
-    """Process all chunks with AI Summaries"""
+def compact_chunks(chunks, source_type="file"):
+    """Convert unstructured chunks into plain JSON dicts for the next pipeline stage"""
+    compacted = []
+    for i, chunk in enumerate(chunks):
+        content_data = separate_content_types(chunk,source_type)
+        content_data['page_number'] = get_page_number(chunk, i)
+        content_data['content_hash'] = hash_chunk_content(content_data)
+        compacted.append(content_data)
+    return compacted
+
+def hash_chunk_content(content_data):
+    """Fingerprint a chunk by its source content (not its position or summary)"""
+    payload = json.dumps({
+        'text': content_data['text'],
+        'tables': content_data['tables'],
+        'images': content_data['images']
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def match_existing_chunks(document_id, compacted):
+    """
+        Tag each compact chunk whose content is already stored with `existing_id`
+        and return the ids of stored chunks that no longer appear in the document.
+    """
+    stored = {}
+    page_size = 1000
+    start = 0
+    while True:
+        result = supabase.table('document_chunks').select('id,content_hash').eq(
+            'document_id', document_id
+        ).order('chunk_index').range(start, start + page_size - 1).execute()
+        for row in result.data or []:
+            stored.setdefault(row['content_hash'], []).append(row['id'])
+        if len(result.data or []) < page_size:
+            break
+        start += page_size
+    
+    for chunk in compacted:
+        # Identical chunks can repeat within a document, so match them one to one
+        matches = stored.get(chunk['content_hash'])
+        if matches:
+            chunk['existing_id'] = matches.pop(0)
+    
+    return [chunk_id for ids in stored.values() for chunk_id in ids]
+
+def summarise_chunks(chunks,document_id,progress: ProgressReporter = None):
+    """Process all compact chunks with AI Summaries, running up to SUMMARY_CONCURRENCY at once"""
     print("🧠 Processing chunks with AI Summaries...")
+    progress = progress or ProgressReporter(document_id)
     
-    processed_chunks = []
     total_chunks = len(chunks)
+    processed_chunks = [None] * total_chunks
+    completed = 0
     
-    for i, chunk in enumerate(chunks):
-        current_chunk = i + 1
-        print(f"   Processing chunk {current_chunk}/{total_chunks}")
-        
-        
-        # update the staus 
-        update_status(document_id,"summarising",{
-            "summarising":{
-                "current_chunk": current_chunk,
-                "total_chunks":total_chunks
-            }
-        })
-        
-        
-        # Analyze chunk content
-        content_data = separate_content_types(chunk,source_type)
-        
-        # Debug prints
-        print(f"     Types found: {content_data['types']}")
-        print(f"     Tables: {len(content_data['tables'])}, Images: {len(content_data['images'])}")
-        
-        # Create AI-enhanced summary if chunk has tables/images
-        if content_data['tables'] or content_data['images']:
-            print(f"     → Creating AI summary for mixed content...")
-            try:
-                enhanced_content = create_ai_summary(
-                    content_data['text'],
-                    content_data['tables'], 
-                    content_data['images']
-                )
-                print(f"     → AI summary created successfully")
-                print(f"     → Enhanced content preview: {enhanced_content[:200]}...")
-            except Exception as e:
-                print(f"     ❌ AI summary failed: {e}")
-                enhanced_content = content_data['text']
-        else:
-            print(f"     → Using raw text (no tables/images)")
-            enhanced_content = content_data['text']
-        
-        # Build the original_content structure
-        original_content = {'text': content_data['text']}
-        if content_data['tables']:
-            original_content['tables'] = content_data['tables']
-        if content_data['images']:
-            original_content['images'] = content_data['images']
-        
-        # Create processed chunk with all data
-        processed_chunk = {
-            'content': enhanced_content,
-            'original_content': original_content, 
-            'type': content_data['types'],
-            'page_number': get_page_number(chunk, i),
-            'char_count': len(enhanced_content)
+    with ThreadPoolExecutor(max_workers=max(1, SUMMARY_CONCURRENCY)) as executor:
+        futures = {
+            executor.submit(process_chunk, chunk, i): i
+            for i, chunk in enumerate(chunks)
         }
-
         
-        processed_chunks.append(processed_chunk)
+        for future in as_completed(futures):
+            i = futures[future]
+            # Results are slotted back by index so chunk order is preserved
+            processed_chunks[i] = future.result()
+            completed += 1
+            print(f"   Processed chunk {completed}/{total_chunks}")
+            
+            # update the staus (throttled by the reporter)
+            progress.update("summarising",{
+                "summarising":{
+                    "current_chunk": completed,
+                    "total_chunks":total_chunks
+                }
+            })
     
     print(f"✅ Processed {len(processed_chunks)} chunks")
     return processed_chunks
 
+def process_chunk(content_data, chunk_index):
+    """Build the processed representation of a single compact chunk"""
+    current_chunk = chunk_index + 1
+    
+    # Debug prints
+    print(f"     [{current_chunk}] Types found: {content_data['types']}")
+    print(f"     [{current_chunk}] Tables: {len(content_data['tables'])}, Images: {len(content_data['images'])}")
+    
+    # Create AI-enhanced summary if chunk has tables/images
+    if content_data['tables'] or content_data['images']:
+        print(f"     [{current_chunk}] → Creating AI summary for mixed content...")
+        try:
+            enhanced_content = create_ai_summary(
+                content_data['text'],
+                content_data['tables'], 
+                content_data['images']
+            )
+        except Exception as e:
+            print(f"     [{current_chunk}] ❌ AI summary failed: {e}")
+            enhanced_content = None
+        
+        if enhanced_content:
+            print(f"     [{current_chunk}] → AI summary created successfully")
+        else:
+            # Fall back to the raw text so one bad chunk never fails the document
+            print(f"     [{current_chunk}] → Falling back to raw text")
+            enhanced_content = content_data['text']
+    else:
+        print(f"     [{current_chunk}] → Using raw text (no tables/images)")
+        enhanced_content = content_data['text']
+    
+    # Build the original_content structure
+    original_content = {'text': content_data['text']}
+    if content_data['tables']:
+        original_content['tables'] = content_data['tables']
+    if content_data['images']:
+        original_content['images'] = content_data['images']
+    
+    # Images (and large tables) go to S3 once per content hash; the row keeps references
+    if content_data['tables'] or content_data['images']:
+        try:
+            original_content = offload_original_content(original_content)
+        except Exception as e:
+            # Keep the payload inline rather than fail the document; backfill_chunk_assets moves it later
+            print(f"     [{current_chunk}] ⚠️ Asset upload failed, keeping content inline: {e}")
+    
+    # Create processed chunk with all data
+    return {
+        'content': enhanced_content,
+        'original_content': original_content, 
+        'type': content_data['types'],
+        'page_number': content_data['page_number'],
+        'char_count': len(enhanced_content),
+        'content_hash': content_data['content_hash']
+    }
+
 def get_page_number(chunk, chunk_index):
     """Get page number from chunk or use fallback"""
     if hasattr(chunk, 'metadata'):
@@ -370,26 +593,18 @@ def separate_content_types(chunk,source_type="file"):
     return content_data
 
 
-def create_ai_summary(text, tables_html, images_base64):
-    """Create AI-enhanced summary for mixed content"""
-    
-    try:
-        # Build the text prompt with more efficient instructions
-        prompt_text = f"""Create a searchable index for this document content.
+# Bump SUMMARY_PROMPT_VERSION to invalidate cached summaries without a template edit;
+# edits to the templates below invalidate them automatically
+SUMMARY_PROMPT_VERSION = "1"
+
+SUMMARY_PROMPT_HEADER = """Create a searchable index for this document content.
 
         CONTENT:
         {text}
 
         """
-        
-        # Add tables if present
-        if tables_html:
-            prompt_text += "TABLES:\n"
-            for i, table in enumerate(tables_html):
-                prompt_text += f"Table {i+1}:\n{table}\n\n"
-        
-        # More concise but effective prompt
-        prompt_text += """
+
+SUMMARY_PROMPT_INSTRUCTIONS = """
                 Generate a structured search index (aim for 250-400 words):
 
                 QUESTIONS: List 5-7 key questions this content answers (use what/how/why/when/who variations)
@@ -413,6 +628,91 @@ def create_ai_summary(text, tables_html, images_base64):
                 Focus on terms users would actually search for. Be specific and comprehensive.
 
                 SEARCH INDEX:"""
+
+summary_cache = build_summary_cache(
+    llm.model_name,
+    SUMMARY_PROMPT_VERSION,
+    SUMMARY_PROMPT_HEADER + SUMMARY_PROMPT_INSTRUCTIONS
+)
+
+
+@celery_app.task
+def clear_summary_cache():
+    """Drop every cached AI summary"""
+    summary_cache.clear()
+    print("🧹 Summary cache cleared")
+
+
+@celery_app.task
+def backfill_chunk_assets(start_after: str = None, batch_size: int = 100):
+    """
+        Move inline base64 images and large tables of chunks stored before assets
+        went to S3, or whose upload failed during processing, into asset references.
+        Reprocessing doesn't do it, since unchanged chunks are reused as they are and
+        an unchanged source is skipped. Safe to re-run; pass the last logged chunk id
+        as `start_after` to resume.
+
+        celery -A tasks call tasks.backfill_chunk_assets
+    """
+    scanned = 0
+    rewritten = 0
+    last_id = start_after
+    while True:
+        query = supabase.table('document_chunks').select('id, original_content').not_.is_('original_content', 'null')
+        if last_id:
+            query = query.gt('id', last_id)
+        result = query.order('id').limit(batch_size).execute()
+        rows = result.data or []
+
+        for row in rows:
+            if needs_offload(row['original_content']):
+                try:
+                    original_content = offload_original_content(row['original_content'])
+                except Exception as e:
+                    print(f"⚠️ Asset backfill skipped chunk {row['id']}: {e}")
+                    continue
+                supabase.table('document_chunks').update({
+                    'original_content': original_content
+                }).eq('id', row['id']).execute()
+                rewritten += 1
+
+        scanned += len(rows)
+        if rows:
+            last_id = rows[-1]['id']
+            print(f"🖼️ Asset backfill: {scanned} chunks scanned, {rewritten} rewritten, last id {last_id}")
+        if len(rows) < batch_size:
+            break
+
+    print(f"✅ Asset backfill done: {rewritten} of {scanned} chunks moved their payloads to S3")
+    return {"scanned": scanned, "rewritten": rewritten}
+
+
+@celery_app.task
+def update_chat_summary(chat_id):
+    """Fold turns that left the chat's verbatim window into its rolling summary"""
+    update_summary(chat_id)
+
+
+def create_ai_summary(text, tables_html, images_base64):
+    """Create AI-enhanced summary for mixed content"""
+    
+    cached_summary = summary_cache.get(text, tables_html, images_base64)
+    if cached_summary:
+        print("     → AI summary served from cache")
+        return cached_summary
+    
+    try:
+        # Build the text prompt with more efficient instructions
+        prompt_text = SUMMARY_PROMPT_HEADER.format(text=text)
+        
+        # Add tables if present
+        if tables_html:
+            prompt_text += "TABLES:\n"
+            for i, table in enumerate(tables_html):
+                prompt_text += f"Table {i+1}:\n{table}\n\n"
+        
+        # More concise but effective prompt
+        prompt_text += SUMMARY_PROMPT_INSTRUCTIONS
         
         # Build message content starting with the text prompt
         message_content = [{"type": "text", "text": prompt_text}]
@@ -429,51 +729,134 @@ def create_ai_summary(text, tables_html, images_base64):
         
         response = llm.invoke([message])
         
+        if response.content:
+            summary_cache.set(text, tables_html, images_base64, response.content)
+        
         return response.content
         
     except Exception as e:
         print(f" AI summary failed: {e}")
 
 
-def store_chunks_with_embeddings(document_id: str, processed_chunks: list):
-    """Generate embeddings and store chunks in one efficient operation"""
+def store_chunks_with_embeddings(document_id: str, processed_chunks: list, progress: ProgressReporter = None, removed_chunk_ids: list = None, project_id: str = None):
+    """
+        Generate embeddings and store chunks in one efficient operation.
+        Chunks tagged with `existing_id` are already stored and only move to their
+        new position; `removed_chunk_ids` are deleted once everything else is written.
+        With `project_id`, the project's local vector index is updated to match.
+    """
     print("Generating embeddings and storing chunks...")
     
-    if not processed_chunks:
-        print(" No chunks to process")
-        return []
-    
-    # Step 1: Generate embeddings for all chunks
-    print(f"Generating embeddings for {len(processed_chunks)} chunks...")
-    
-    # Extract content for embedding generation
-    texts = [chunk_data['content'] for chunk_data in processed_chunks]
+    new_chunks = [(i, chunk_data) for i, chunk_data in enumerate(processed_chunks) if not chunk_data.get('existing_id')]
+    retained_positions = [
+        {'id': chunk_data['existing_id'], 'chunk_index': i, 'page_number': chunk_data['page_number']}
+        for i, chunk_data in enumerate(processed_chunks) if chunk_data.get('existing_id')
+    ]
+    stored_chunk_ids = []
+    rows = []
     
-    # Generate embeddings in batches to avoid API limits
-    batch_size = 10
-    all_embeddings = []
+    if new_chunks:
+        # Step 1: Generate embeddings for the new chunks
+        print(f"Generating embeddings for {len(new_chunks)} chunks...")
+        
+        # Extract content for embedding generation
+        texts = [chunk_data['content'] for _, chunk_data in new_chunks]
+        
+        # Look everything up in the embedding cache first; only unique misses go to the API
+        all_embeddings = embedding_cache.get_many(texts)
+        miss_texts = list(dict.fromkeys(
+            text for text, embedding in zip(texts, all_embeddings) if embedding is None
+        ))
+        cache_hits = len(texts) - sum(1 for embedding in all_embeddings if embedding is None)
+        print(f" Embedding cache: {cache_hits} hits, {len(miss_texts)} unique misses")
+        
+        # Generate embeddings in batches to avoid API limits
+        batch_size = 10
+        generated = {}
+        
+        for i in range(0, len(miss_texts), batch_size):
+            batch_texts = miss_texts[i:i + batch_size]
+            batch_embeddings = embeddings_model.embed_documents(batch_texts)
+            embedding_cache.set_many(batch_texts, batch_embeddings)
+            generated.update(zip(batch_texts, batch_embeddings))
+            print(f" ✅ Generated embeddings for batch {i//batch_size + 1}/{(len(miss_texts) + batch_size - 1)//batch_size}")
+        
+        all_embeddings = [
+            embedding if embedding is not None else generated[text]
+            for text, embedding in zip(texts, all_embeddings)
+        ]
+        
+        if progress:
+            progress.update(details={
+                "embedding": {
+                    "cache_hits": cache_hits,
+                    "cache_misses": len(miss_texts)
+                }
+            })
+        
+        # Step 2: Store chunks with embeddings
+        print("Storing chunks with embeddings in database...")
+        
+        for (i, chunk_data), embedding in zip(new_chunks, all_embeddings):
+            # Add document_id, chunk_index, and embedding. The id is generated here so
+            # the insert doesn't need to echo every row (and its embedding) back to us
+            rows.append({
+                **chunk_data,
+                'id': str(uuid.uuid4()),
+                'document_id': document_id,
+                'chunk_index': i,
+                'embedding': embedding
+            })
+        
+        total_batches = (len(rows) + CHUNK_INSERT_BATCH_SIZE - 1) // CHUNK_INSERT_BATCH_SIZE
+        for i in range(0, len(rows), CHUNK_INSERT_BATCH_SIZE):
+            batch = rows[i:i + CHUNK_INSERT_BATCH_SIZE]
+            insert_chunk_batch(batch)
+            stored_chunk_ids.extend(row['id'] for row in batch)
+            print(f" ✅ Stored batch {i//CHUNK_INSERT_BATCH_SIZE + 1}/{total_batches}")
     
-    for i in range(0, len(texts), batch_size):
-        batch_texts = texts[i:i + batch_size]
-        batch_embeddings = embeddings_model.embed_documents(batch_texts)
-        all_embeddings.extend(batch_embeddings)
-        print(f" ✅ Generated embeddings for batch {i//batch_size + 1}/{(len(texts) + batch_size - 1)//batch_size}")
+    # Step 3: Move retained chunks into place and drop the ones that disappeared
+    if retained_positions:
+        supabase.rpc('update_chunk_positions', {'p_positions': retained_positions}).execute()
+        stored_chunk_ids.extend(position['id'] for position in retained_positions)
+        print(f" ♻️ Reused {len(retained_positions)} unchanged chunks")
     
-    # Step 2: Store chunks with embeddings
-    print("Storing chunks with embeddings in database...")
-    stored_chunk_ids = []
+    if removed_chunk_ids:
+        for i in range(0, len(removed_chunk_ids), 200):
+            supabase.table('document_chunks').delete(returning=ReturnMethod.minimal).in_(
+                'id', removed_chunk_ids[i:i + 200]
+            ).execute()
+        print(f" 🗑️ Removed {len(removed_chunk_ids)} stale chunks")
     
-    for i, (chunk_data, embedding) in enumerate(zip(processed_chunks, all_embeddings)):
-        # Add document_id, chunk_index, and embedding
-        chunk_data_with_embedding = {
-            **chunk_data,
-            'document_id': document_id,
-            'chunk_index': i,
-            'embedding': embedding
-        }
-        
-        result = supabase.table('document_chunks').insert(chunk_data_with_embedding).execute()
-        stored_chunk_ids.append(result.data[0]['id'])
+    if project_id:
+        apply_chunk_changes(project_id, [(row['id'], row['embedding']) for row in rows], removed_chunk_ids)
     
     print(f"Successfully stored {len(processed_chunks)} chunks with embeddings")
     return stored_chunk_ids
+
+def insert_chunk_batch(rows: list, retries: int = CHUNK_INSERT_RETRIES):
+    """
+        Insert a batch of chunk rows in one request.
+        Failed batches are retried with backoff, then split in half so a single bad
+        row only fails itself. Rows carry their own ids, so re-sending rows that did
+        land is a no-op rather than a duplicate.
+    """
+    for attempt in range(retries + 1):
+        try:
+            supabase.table('document_chunks').upsert(
+                rows,
+                ignore_duplicates=True,
+                returning=ReturnMethod.minimal
+            ).execute()
+            return
+        except Exception as e:
+            print(f" ⚠️ Inserting {len(rows)} chunks failed (attempt {attempt + 1}/{retries + 1}): {e}")
+            if attempt < retries:
+                time.sleep(2 ** attempt)
+    
+    if len(rows) == 1:
+        raise Exception(f"Failed to store chunk {rows[0]['chunk_index']}")
+    
+    middle = len(rows) // 2
+    insert_chunk_batch(rows[:middle], retries=0)
+    insert_chunk_batch(rows[middle:], retries=0)
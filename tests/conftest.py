@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Modules read their configuration at import time; the clients they build
+# never connect unless a test calls them
+os.environ.setdefault("SUPABASE_API_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-service-key")
+os.environ.setdefault("OPENROUTER_API_KEY", "test-openrouter-key")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from jwt.algorithms import RSAAlgorithm
+
+from routes import auth
+
+
+class FakeRequest:
+    def __init__(self, token):
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.cookies = {}
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+def make_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def make_jwk(private_key, kid):
+    jwk = RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    return {**jwk, "kid": kid, "use": "sig", "alg": "RS256"}
+
+
+def make_token(private_key, kid, **claims):
+    now = int(time.time())
+    payload = {"sub": "user_123", "iat": now, "exp": now + 60, **claims}
+    return jwt.encode(payload, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+def authenticate(token):
+    return asyncio.run(auth.get_current_user(FakeRequest(token)))
+
+
+@pytest.fixture
+def signing_keys(monkeypatch):
+    """Serves a JWKS holding the keys in the returned dict, counting fetches"""
+    keys = {"kid-1": make_key()}
+    fetches = []
+
+    def fake_get(url, headers=None, timeout=None):
+        fetches.append(url)
+        return FakeResponse({"keys": [make_jwk(key, kid) for kid, key in keys.items()]})
+
+    monkeypatch.setattr(auth.httpx, "get", fake_get)
+    monkeypatch.setattr(auth, "CLERK_JWT_KEY", None)
+    monkeypatch.setattr(auth, "jwks", auth.ClerkJWKS("https://clerk.test/jwks"))
+    auth.token_cache.clear()
+    yield keys, fetches
+    auth.token_cache.clear()
+
+
+def test_valid_token_is_accepted(signing_keys):
+    keys, _ = signing_keys
+    assert authenticate(make_token(keys["kid-1"], "kid-1")) == "user_123"
+
+
+def test_expired_token_is_rejected(signing_keys):
+    keys, _ = signing_keys
+    now = int(time.time())
+    token = make_token(keys["kid-1"], "kid-1", iat=now - 600, exp=now - 300)
+
+    with pytest.raises(HTTPException) as error:
+        authenticate(token)
+    assert error.value.status_code == 401
+
+
+def test_wrong_authorized_party_is_rejected(signing_keys):
+    keys, _ = signing_keys
+    token = make_token(keys["kid-1"], "kid-1", azp="https://evil.example")
+
+    with pytest.raises(HTTPException) as error:
+        authenticate(token)
+    assert "authorized party" in error.value.detail
+
+
+def test_unknown_kid_refreshes_the_jwks(signing_keys, monkeypatch):
+    keys, fetches = signing_keys
+    monkeypatch.setattr(auth, "JWKS_MIN_REFRESH_INTERVAL", 0)
+    authenticate(make_token(keys["kid-1"], "kid-1"))
+
+    # Key rotation: a token signed with a key the cached JWKS doesn't have yet
+    keys["kid-2"] = make_key()
+    assert authenticate(make_token(keys["kid-2"], "kid-2")) == "user_123"
+    assert len(fetches) == 2
+
+
+def test_bogus_kids_do_not_hammer_the_jwks(signing_keys):
+    keys, fetches = signing_keys
+    authenticate(make_token(keys["kid-1"], "kid-1"))
+
+    with pytest.raises(HTTPException):
+        authenticate(make_token(make_key(), "kid-bogus"))
+    assert len(fetches) == 1
+
+
+def test_cached_token_expires_with_the_token(signing_keys, monkeypatch):
+    keys, _ = signing_keys
+    token = make_token(keys["kid-1"], "kid-1")
+    assert authenticate(token) == "user_123"
+
+    verified = []
+    real_verify = auth.verify_session_token
+
+    def counting_verify(token, key):
+        verified.append(token)
+        return real_verify(token, key)
+
+    monkeypatch.setattr(auth, "verify_session_token", counting_verify)
+
+    # Served from the token cache without verifying again
+    assert authenticate(token) == "user_123"
+    assert verified == []
+
+    # Past the token's exp the cached entry is not honoured: the token is verified again
+    real_time = time.time
+    monkeypatch.setattr(auth.time, "time", lambda: real_time() + 120)
+    authenticate(token)
+    assert verified == [token]
@@ -0,0 +1,61 @@
+from services import context_service
+from services.context_service import count_tokens, pack_context
+
+
+def make_chunk(index, content, **fields):
+    return {"id": f"chunk-{index}", "filename": "report.pdf", "page_number": index, "content": content, **fields}
+
+
+def words(prefix, count):
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+def test_near_duplicates_are_skipped_and_replaced():
+    chunks = [
+        make_chunk(1, words("alpha", 40)),
+        make_chunk(2, words("alpha", 38)),
+        make_chunk(3, words("beta", 40)),
+    ]
+
+    context, packed, metrics = pack_context(chunks, {"final_context_size": 2})
+
+    assert [chunk["id"] for chunk in packed] == ["chunk-1", "chunk-3"]
+    assert metrics["dropped_duplicates"] == 1
+    assert context.startswith("[1] (report.pdf, page 1)\n")
+    assert "[2] (report.pdf, page 3)\n" in context
+
+
+def test_chunks_over_budget_give_way_to_smaller_ones(monkeypatch):
+    monkeypatch.setattr(context_service, "CONTEXT_TOKENS_PER_CHUNK", 100)
+    chunks = [
+        make_chunk(1, words("alpha", 60)),
+        make_chunk(2, words("beta", 400)),
+        make_chunk(3, words("gamma", 20)),
+    ]
+
+    context, packed, metrics = pack_context(chunks, {"final_context_size": 3})
+
+    assert [chunk["id"] for chunk in packed] == ["chunk-1", "chunk-3"]
+    assert metrics["dropped_over_budget"] == 1
+    assert count_tokens(context) <= metrics["context_budget_tokens"]
+
+
+def test_only_the_best_chunk_is_truncated(monkeypatch):
+    monkeypatch.setattr(context_service, "CONTEXT_TOKENS_PER_CHUNK", 100)
+    chunks = [make_chunk(1, words("alpha", 400))]
+
+    context, packed, metrics = pack_context(chunks, {"final_context_size": 1})
+
+    assert packed == chunks
+    assert metrics["truncated_chunks"] == 1
+    assert count_tokens(context) <= metrics["context_budget_tokens"]
+
+
+def test_image_payloads_never_reach_the_context():
+    payload = "data:image/png;base64," + "A" * 400
+    chunks = [make_chunk(1, f"A chart of revenue {payload} by quarter")]
+
+    context, _, _ = pack_context(chunks, {"final_context_size": 1})
+
+    assert "AAAA" not in context
+    assert "[image omitted]" in context
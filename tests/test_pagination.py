@@ -0,0 +1,29 @@
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from routes.pagination import decode_cursor, encode_cursor
+
+
+def raw_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("2026-10-17T09:30:00+00:00", "1b4e28ba-2fa1-11d2-883f-0016d3cca427")
+    assert decode_cursor(cursor) == ("2026-10-17T09:30:00+00:00", "1b4e28ba-2fa1-11d2-883f-0016d3cca427")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 at all!",
+    raw_cursor("2026-10-17T09:30:00", "1b4e28ba-2fa1-11d2-883f-0016d3cca427", "extra"),
+    # Filter injection through either half of the cursor
+    raw_cursor('2026-10-17T09:30:00",id.gt.0', "1b4e28ba-2fa1-11d2-883f-0016d3cca427"),
+    raw_cursor("2026-10-17T09:30:00", "0),project_id.neq.(0"),
+])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("pypdf")
+pytest.importorskip("unstructured.partition.pdf")
+
+from services.pdf_service import plan_page_runs, split_runs
+
+
+def test_consecutive_pages_with_one_strategy_form_a_run():
+    strategies = ["fast", "fast", "hi_res", "hi_res", "hi_res", "fast"]
+
+    assert plan_page_runs(strategies) == [("fast", 1, 2), ("hi_res", 3, 5), ("fast", 6, 6)]
+
+
+def test_no_pages_no_runs():
+    assert plan_page_runs([]) == []
+
+
+def test_runs_are_split_into_bounded_ranges():
+    runs = [("fast", 1, 45), ("hi_res", 46, 47)]
+
+    assert split_runs(runs, 20) == [
+        ("fast", 1, 20),
+        ("fast", 21, 40),
+        ("fast", 41, 45),
+        ("hi_res", 46, 47),
+    ]
@@ -0,0 +1,69 @@
+import pytest
+
+from services import rerank_service
+from services.rerank_service import LexicalReranker, rerank
+
+
+def make_chunks(*contents):
+    return [{"id": f"chunk-{i}", "content": content} for i, content in enumerate(contents)]
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    rerank_service._rerankers.clear()
+    rerank_service.score_cache.clear()
+    yield
+    rerank_service._rerankers.clear()
+    rerank_service.score_cache.clear()
+
+
+class CountingCrossEncoder:
+    """Pairwise stand-in for a cross-encoder: the score depends on (query, text) only"""
+
+    cacheable = True
+    scored = []
+
+    def __init__(self, model_name):
+        self.name = model_name
+
+    def score(self, query, texts):
+        CountingCrossEncoder.scored.extend(texts)
+        return [float(text.count(query)) for text in texts]
+
+
+def test_lexical_scores_every_candidate_together():
+    first = make_chunks("apple pie recipe", "banana bread", "apple apple tart")
+    rerank("apple", first, "lexical", 3)
+
+    # A second query over a different candidate set must not reuse the first set's scores
+    second = make_chunks("apple pie recipe", "apple crumble", "cherry apple jam", "plain toast")
+    reranked, metrics = rerank("apple", second, "lexical", 4)
+
+    expected = LexicalReranker().score("apple", [chunk["content"] for chunk in second])
+    assert [chunk["rerank_score"] for chunk in reranked] == sorted(expected, reverse=True)
+    assert metrics["rerank_cache_hits"] == 0
+
+
+def test_cross_encoder_scores_are_cached_per_pair(monkeypatch):
+    monkeypatch.setattr(rerank_service, "CrossEncoderReranker", CountingCrossEncoder)
+    CountingCrossEncoder.scored = []
+
+    rerank("tea", make_chunks("tea", "coffee"), "some-model", 2)
+    reranked, metrics = rerank("tea", make_chunks("tea", "coffee", "tea tea"), "some-model", 3)
+
+    assert CountingCrossEncoder.scored == ["tea", "coffee", "tea tea"]
+    assert metrics["rerank_cache_hits"] == 2
+    assert [chunk["content"] for chunk in reranked] == ["tea tea", "tea", "coffee"]
+
+
+def test_unavailable_model_keeps_retrieval_order(monkeypatch):
+    def fail(model_name):
+        raise ImportError("sentence-transformers is not installed")
+
+    monkeypatch.setattr(rerank_service, "CrossEncoderReranker", fail)
+    chunks = make_chunks("third best", "best", "second best")
+
+    reranked, metrics = rerank("best", chunks, "reranker-english-v3.0", 2)
+
+    assert reranked == chunks[:2]
+    assert metrics["rerank_model"] is None
@@ -0,0 +1,26 @@
+from services.retrieval_service import merge_results
+
+
+def test_merge_keeps_each_chunks_best_score_and_counts_hits():
+    merged = merge_results([
+        [{"id": "a", "score": 0.5}, {"id": "b", "score": 0.9}],
+        [{"id": "a", "score": 0.8}, {"id": "c", "score": 0.1}],
+        [{"id": "a", "score": 0.2}],
+    ])
+
+    assert [(chunk["id"], chunk["score"], chunk["query_hits"]) for chunk in merged] == [
+        ("b", 0.9, 1),
+        ("a", 0.8, 3),
+        ("c", 0.1, 1),
+    ]
+
+
+def test_merge_breaks_score_ties_by_query_hits_and_tolerates_missing_scores():
+    merged = merge_results([
+        [{"id": "a", "score": 0.5}, {"id": "b", "score": None}],
+        [{"id": "c", "score": 0.5}, {"id": "b", "score": None}],
+        [{"id": "c", "score": 0.5}],
+    ])
+
+    assert [chunk["id"] for chunk in merged] == ["c", "a", "b"]
+    assert merged[2]["query_hits"] == 2